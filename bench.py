@@ -0,0 +1,207 @@
+import asyncio
+import datetime as dt
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from typing import Awaitable, Callable
+
+import constants
+import database as db
+import listings
+import snapshots
+
+# name: coroutine function printing its own results
+BENCHMARKS: dict[str, Callable[[], Awaitable[None]]] = {}
+IMPORT_MODULES = ("tnp", "constants", "logger", "database", "http_client",
+                  "scraper", "bot")
+
+
+def benchmark(name: str):
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+async def atimed(func, *args, repeat: int = 5) -> float:
+    # Best of `repeat` runs in seconds
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def import_time(module: str) -> float:
+    # Import a module in a fresh interpreter, seconds spent in the import only
+    code = ("import time; s = time.perf_counter(); "
+            f"import {module}; print(time.perf_counter() - s)")
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True,
+                            text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode:
+        raise RuntimeError(result.stderr.strip().rsplit("\n", 1)[-1])
+    return float(result.stdout)
+
+
+@benchmark("import")
+async def bench_import():
+    for module in IMPORT_MODULES:
+        try:
+            print(f"import {module:<12} {import_time(module) * 1000:8.1f} ms")
+        except RuntimeError as e:
+            print(f"import {module:<12} failed: {e}")
+
+
+@benchmark("db")
+async def bench_db(jobs: int = 1000):
+    today = dt.date.today()
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_NAME = os.path.join(tmp, "bench.db")
+        await db.create_table()
+        start = time.perf_counter()
+        # Concurrent like a notification fan-out, the writer group commits them
+        await asyncio.gather(*(
+            db.insert_job(f"Job {i}", f"uid{i}", str(today + dt.timedelta(days=i % 30)),
+                          str(today - dt.timedelta(days=i % 30)))
+            for i in range(jobs)
+        ))
+        print(f"insert_job x{jobs} {(time.perf_counter() - start) * 1000:10.1f} ms "
+              f"in {db.start_writer().commits} commits")
+        student = await db.insert_student(1, "bench", "Bench")
+        print(f"fetch_active_jobs {await atimed(db.fetch_active_jobs, student.id) * 1000:10.3f} ms")
+        print(f"fetch_all_jobs    {await atimed(db.fetch_all_jobs, student.id) * 1000:10.3f} ms")
+        await db.stop_writer()
+
+
+@benchmark("index")
+async def bench_index(students: int = 10_000, jobs: int = 300, statuses: int = 20):
+    # Per-student active jobs lookup from ACTIVE_JOBS versus SQLite
+    today = dt.date.today()
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_NAME = os.path.join(tmp, "bench.db")
+        await db.create_table()
+        async with db.database_connection() as con:
+            await con.executemany(
+                "INSERT INTO job(id, title, uid, end_date, posted_date) VALUES (?, ?, ?, ?, ?);",
+                [(i, f"Job {i}", f"uid{i}", str(today + dt.timedelta(days=rng.randint(-30, 30))),
+                  str(today - dt.timedelta(days=rng.randint(0, 60)))) for i in range(1, jobs + 1)]
+            )
+            await con.executemany(
+                "INSERT INTO student(id, chat_id, username) VALUES (?, ?, ?);",
+                [(i, str(i), f"user{i}") for i in range(1, students + 1)]
+            )
+            await con.executemany(
+                "INSERT INTO job_status(student_id, job_id, interested, applied, skip) "
+                "VALUES (?, ?, ?, ?, ?);",
+                [(i, job_id, rng.random() < .3, rng.random() < .5, rng.random() < .2)
+                 for i in range(1, students + 1)
+                 for job_id in rng.sample(range(1, jobs + 1), statuses)]
+            )
+            await con.commit()
+        start = time.perf_counter()
+        index = await db.load_index(force=True)
+        print(f"load_index             {(time.perf_counter() - start) * 1000:10.1f} ms "
+              f"({len(index.jobs)} live jobs)")
+        size = sum(sys.getsizeof(bits) for field in index.status.values()
+                   for bits in field.values())
+        print(f"status bitsets         {size / 1024:10.1f} KiB for {students} students")
+
+        start = time.perf_counter()
+        for student_id in range(1, students + 1):
+            index.active(student_id)
+        elapsed = (time.perf_counter() - start) / students
+        print(f"index lookup           {elapsed * 1e6:10.1f} us/student")
+        sample = rng.sample(range(1, students + 1), 200)
+        start = time.perf_counter()
+        for student_id in sample:
+            await db.fetch_active_jobs_sql(student_id)
+        elapsed = (time.perf_counter() - start) / len(sample)
+        print(f"SQLite lookup          {elapsed * 1e6:10.1f} us/student")
+        db.ACTIVE_JOBS.clear()
+
+
+def listings_page(rows: int) -> bytes:
+    body = "".join(
+        f"<tr><td>Job {i}</td><td>0{i % 9 + 1}/07/2026</td><td>01/06/2026</td>"
+        f"<td><a href='/jobs/view/uid{i}'>View</a></td></tr>"
+        for i in range(rows)
+    )
+    return (f"<html><body><table id='job-listings'><tbody>{body}</tbody></table>"
+            "</body></html>").encode()
+
+
+async def loop_lag(coro, interval: float = 0.001) -> tuple[float, float]:
+    # Run coro while a ticker measures how late the event loop wakes it up,
+    # returns (seconds taken by coro, worst lag in seconds)
+    loop = asyncio.get_running_loop()
+    worst, done = 0.0, asyncio.Event()
+
+    async def ticker():
+        nonlocal worst
+        while not done.is_set():
+            expected = loop.time() + interval
+            await asyncio.sleep(interval)
+            worst = max(worst, loop.time() - expected)
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    await coro
+    elapsed = time.perf_counter() - start
+    done.set()
+    await task
+    return elapsed, worst
+
+
+async def _inline(content: bytes, encoding: str):
+    listings.parse_job_rows(content, encoding)
+
+
+async def bench_pages(pages: list[tuple[str, bytes, str]]):
+    # Parse time and event loop lag inline versus in the worker pool
+    # Start the worker and import lxml in it up front
+    listings.parse_pool().submit(listings.parse_job_rows, listings_page(1)).result()
+    for name, content, encoding in pages:
+        inline_time, inline_lag = await loop_lag(_inline(content, encoding))
+        pool_time, pool_lag = await loop_lag(
+            asyncio.get_running_loop().run_in_executor(
+                listings.parse_pool(), listings.parse_job_rows, content, encoding
+            )
+        )
+        print(f"{name:<14} {len(content) / 1024:8.0f} KiB  "
+              f"inline {inline_time * 1000:7.1f} ms lag {inline_lag * 1000:7.1f} ms  "
+              f"pool {pool_time * 1000:7.1f} ms lag {pool_lag * 1000:7.1f} ms")
+    listings.shutdown_pool()
+
+
+@benchmark("parse")
+async def bench_parse():
+    print(f"inline up to {constants.PARSE_INLINE_MAX_BYTES / 1024:.0f} KiB, "
+          f"{constants.PARSE_WORKERS} worker(s)")
+    pages = [(f"{rows} rows", listings_page(rows), "utf-8") for rows in (50, 1000, 20_000)]
+    # Real captured pages too, the newest few from the snapshot archive
+    pages += [(os.path.basename(path)[:12], *snapshots.load_snapshot(path))
+              for path in snapshots.list_snapshots()[-3:]]
+    await bench_pages(pages)
+
+
+async def run(names: list[str]) -> int:
+    unknown = set(names) - BENCHMARKS.keys()
+    if unknown:
+        print(f"Unknown benchmark(s): {', '.join(sorted(unknown))}. "
+              f"Available: {', '.join(BENCHMARKS)}", file=sys.stderr)
+        return 2
+    for name in names or BENCHMARKS:
+        print(f"== {name}")
+        await BENCHMARKS[name]()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(run(sys.argv[1:])))
@@ -1,16 +1,19 @@
 import datetime as dt
-import os
+import httpx
+import sqlite3
 from functools import wraps, lru_cache
 from operator import attrgetter
 
 import database as db
+import listings
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, ContextTypes, CommandHandler, CallbackQueryHandler
 from telegram.constants import ParseMode
 
-from constants import MY_CHAT_ID
+from constants import MY_CHAT_ID, TOKEN
 from helpers import job_id
+from http_client import CircuitOpenError
 from logger import logger
 from scraper import get_and_save_new_jobs
 
@@ -92,17 +95,28 @@ async def task_get_latest_data(ctx: ContextTypes.DEFAULT_TYPE):
     if not SCRAPER_RUNNING:
         SCRAPER_RUNNING = True
         logger.info("Run task to get new data from site.")
-        await ctx.bot.send_message(
-            MY_CHAT_ID, "Started the scraper to get latest data."
-        )
-        if new_jobs := await get_and_save_new_jobs():
+        try:
             await ctx.bot.send_message(
-                MY_CHAT_ID, "New jobs posted",
-                reply_markup=InlineKeyboardMarkup(jobs_inline_layout(new_jobs))
+                MY_CHAT_ID, "Started the scraper to get latest data."
             )
-        elif ctx.job.data == "force":
-            await ctx.bot.send_message(MY_CHAT_ID, "No new job posted.")
-        SCRAPER_RUNNING = False
+            result = await get_and_save_new_jobs()
+            if result.new:
+                await ctx.bot.send_message(
+                    MY_CHAT_ID, "New jobs posted",
+                    reply_markup=InlineKeyboardMarkup(jobs_inline_layout(result.new))
+                )
+            if result.updated:
+                await ctx.bot.send_message(
+                    MY_CHAT_ID, "Jobs updated on the portal",
+                    reply_markup=InlineKeyboardMarkup(jobs_inline_layout(result.updated))
+                )
+            if not (result.new or result.updated) and ctx.job.data == "force":
+                await ctx.bot.send_message(MY_CHAT_ID, "No new job posted.")
+        except (httpx.HTTPError, CircuitOpenError) as e:
+            logger.exception("Scraper failed")
+            await ctx.bot.send_message(MY_CHAT_ID, f"Scraper failed: {e!r}")
+        finally:
+            SCRAPER_RUNNING = False
 
 
 async def task_near_end_date_jobs(ctx: ContextTypes.DEFAULT_TYPE):
@@ -176,7 +190,7 @@ async def handler_update_job_field(update: Update, ctx: ContextTypes.DEFAULT_TYP
     await query.answer()  # Required
 
     field = query.data
-    logger.info("Update field %s", field)
+    logger.info("Update field %s", field, extra={"chat_id": update.effective_user.id})
     job = await db.fetch_one_job(update.effective_user.id, job_id(field))
     if field.startswith("INT"):
         await db.update_job_status_field(update.effective_user.id, job.id,
@@ -197,7 +211,8 @@ async def handler_update_job_field(update: Update, ctx: ContextTypes.DEFAULT_TYP
 async def handler_job_details(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()  # Required
-    logger.info("Get job info %s-%s", query.from_user.id, query.data)
+    logger.info("Get job info %s-%s", query.from_user.id, query.data,
+                extra={"chat_id": query.from_user.id})
 
     job = await db.fetch_one_job(update.effective_user.id, job_id(query.data))
     interested = "Not Interested" if job.interested else "Interested"
@@ -241,6 +256,19 @@ async def handler_get_latest(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Previous scraper still running. Please wait")
 
 
+@restricted
+async def handler_check_index(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    # Compare the active jobs index of this process with the database
+    if mismatches := await db.verify_index():
+        logger.warning("Active jobs index differs for student(s) %s, reload", mismatches)
+        await db.load_index(force=True)
+        await update.message.reply_text(
+            f"Index differed for {len(mismatches)} student(s), reloaded."
+        )
+    else:
+        await update.message.reply_text("Active jobs index matches the database.")
+
+
 @is_registered
 async def handler_get_near_end_date_jobs(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     logger.info("Get near end jobs %s", update.effective_user.id)
@@ -254,7 +282,10 @@ async def handler_register(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     logger.info("Register user %s-%s-%s", chat_id, username, full_name)
     if await db.student_is_registered(chat_id) is False:
         if not await db.student_exists(chat_id):
-            if await db.insert_student(chat_id, username, full_name) is None:
+            try:
+                await db.insert_student(chat_id, username, full_name)
+            except sqlite3.Error:
+                logger.exception("Something went wrong while inserting %s", chat_id)
                 await update.message.reply_text("Oh no! Something went wrong. "
                                                 "Please try again.")
                 return
@@ -293,8 +324,19 @@ async def handler_unregister(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
                                         "Send /register to register again.")
 
 
+async def post_init(application: Application):
+    await db.migrate()
+    db.start_writer()
+
+
+async def post_shutdown(application: Application):
+    await db.stop_writer()
+    listings.shutdown_pool()
+
+
 def main():
-    application = Application.builder().token(os.environ["TOKEN"]).concurrent_updates(True).build()
+    application = (Application.builder().token(TOKEN).concurrent_updates(True)
+                   .post_init(post_init).post_shutdown(post_shutdown).build())
     application.job_queue.run_repeating(task_notify_active_jobs, 1800, first=1)
     application.job_queue.run_repeating(task_get_latest_data, 4 * 60 * 60, first=1)
     application.job_queue.run_daily(task_near_end_date_jobs, dt.time(8, 0))
@@ -308,6 +350,7 @@ def main():
     application.add_handler(CommandHandler("all", handler_all_jobs))
     application.add_handler(CommandHandler("end_date", handler_get_near_end_date_jobs))
     application.add_handler(CommandHandler("latest", handler_get_latest))
+    application.add_handler(CommandHandler("checkindex", handler_check_index))
     application.add_handler(CommandHandler("notify", handler_notify))
     application.add_handler(CommandHandler("register", handler_register))
     application.add_handler(CommandHandler("unnotify", handler_unnotify))
@@ -1,7 +1,53 @@
 import os
-from dotenv import load_dotenv
 
-load_dotenv()
+# Settings are read from the environment (and .env) on first access only, so
+# importing this module never fails or pays for python-dotenv.
+REQUIRED = object()
+# name: (environment variable, type, default)
+SETTINGS = {
+    "MY_CHAT_ID": ("CHAT_ID", int, REQUIRED),
+    "DB_NAME": ("DB_NAME", str, REQUIRED),
+    "TOKEN": ("TOKEN", str, REQUIRED),
+    "BASE_URL": ("URL", str, REQUIRED),
+    "USERNAME": ("USERNAME", str, REQUIRED),
+    "PASSWORD": ("PASSWORD", str, REQUIRED),
+    # text or json
+    "LOG_FORMAT": ("LOG_FORMAT", str, "text"),
+    # Records per second per call site below WARNING, 0 disables the limit
+    "LOG_RATE_LIMIT": ("LOG_RATE_LIMIT", float, 0.0),
+    "LOG_BURST": ("LOG_BURST", int, 5),
+    # Listings pages are parsed in this many worker processes, 0 parses inline
+    "PARSE_WORKERS": ("PARSE_WORKERS", int, 1),
+    # Pages up to this size are always parsed inline
+    "PARSE_INLINE_MAX_BYTES": ("PARSE_INLINE_MAX_BYTES", int, 64 * 1024),
+    # Fetched listings pages are archived here for `tnp scrape --replay`,
+    # relative to the repo directory
+    "SNAPSHOT_DIR": ("SNAPSHOT_DIR", str, "./snapshots"),
+    # Number of newest distinct snapshots kept, 0 keeps all
+    "SNAPSHOT_RETENTION": ("SNAPSHOT_RETENTION", int, 100),
+}
+_env_loaded = False
 
-MY_CHAT_ID = int(os.environ["CHAT_ID"])
-DB_NAME = os.environ["DB_NAME"]
+
+def load_env() -> None:
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
+
+
+def __getattr__(name: str):
+    try:
+        env_name, cast, default = SETTINGS[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+    load_env()
+    if env_name in os.environ:
+        value = cast(os.environ[env_name])
+    elif default is REQUIRED:
+        raise KeyError(env_name)
+    else:
+        value = default
+    globals()[name] = value  # Cache, next lookups skip __getattr__
+    return value
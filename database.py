@@ -1,20 +1,58 @@
 import asyncio
+import hashlib
+import os
 import sqlite3
+import time
 import aiosqlite
 
 from collections import namedtuple
+from typing import Any, Awaitable, Callable
 
+import constants
+from job_index import ActiveJobsIndex
 from logger import logger
-from constants import DB_NAME
+
+# Overrides constants.DB_NAME when set, e.g. by tests
+DB_NAME: str | None = None
+# Next to this module, cron runs the CLI from any directory
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema.sql")
+# Applied in order by migrate(), PRAGMA user_version stores how many ran
+MIGRATIONS: list[str] = [
+    "ALTER TABLE job ADD COLUMN fingerprint VARCHAR(64);",
+    "CREATE TABLE IF NOT EXISTS change_counter("
+    "id INTEGER NOT NULL PRIMARY KEY CHECK (id = 1), value INTEGER NOT NULL DEFAULT 0);",
+    "INSERT OR IGNORE INTO change_counter(id, value) VALUES (1, 0);",
+    "CREATE TRIGGER IF NOT EXISTS job_insert_count AFTER INSERT ON job "
+    "BEGIN UPDATE change_counter SET value=value + 1 WHERE id=1; END;",
+    "CREATE TRIGGER IF NOT EXISTS job_update_count AFTER UPDATE ON job "
+    "BEGIN UPDATE change_counter SET value=value + 1 WHERE id=1; END;",
+    "CREATE TRIGGER IF NOT EXISTS job_delete_count AFTER DELETE ON job "
+    "BEGIN UPDATE change_counter SET value=value + 1 WHERE id=1; END;",
+    "CREATE TRIGGER IF NOT EXISTS job_status_insert_count AFTER INSERT ON job_status "
+    "BEGIN UPDATE change_counter SET value=value + 1 WHERE id=1; END;",
+    "CREATE TRIGGER IF NOT EXISTS job_status_update_count AFTER UPDATE ON job_status "
+    "BEGIN UPDATE change_counter SET value=value + 1 WHERE id=1; END;",
+    "CREATE TRIGGER IF NOT EXISTS job_status_delete_count AFTER DELETE ON job_status "
+    "BEGIN UPDATE change_counter SET value=value + 1 WHERE id=1; END;",
+]
 
 JobDetailShort = namedtuple("JobDetailShort", ("id", "title"))
 JobDetailFull = namedtuple("JobDetailFull", ("id", "title", "end_date", "posted_date",
                                              "interested", "applied", "skip"))
 StudentDetail = namedtuple("StudentDetail", ("id", "chat_id", "username", "full_name"))
+WriteOp = Callable[[aiosqlite.Connection], Awaitable[Any]]
+# Live jobs and per-student statuses, see load_index()
+ACTIVE_JOBS = ActiveJobsIndex()
 
 
 def database_connection() -> aiosqlite.Connection:
-    return aiosqlite.connect(DB_NAME, detect_types=sqlite3.PARSE_DECLTYPES)
+    return aiosqlite.connect(DB_NAME or constants.DB_NAME, detect_types=sqlite3.PARSE_DECLTYPES)
+
+
+def job_fingerprint(title: str, end_date, posted_date) -> str:
+    # Hash of the fields the portal may change for an already posted uid
+    data = "\x1f".join((title, str(end_date), str(posted_date)))
+    return hashlib.blake2b(data.encode(), digest_size=16).hexdigest()
 
 
 def job_short_detail_factory(_, row):
@@ -28,43 +66,219 @@ def job_full_detail_factory(_, row):
         return JobDetailFull(*row, False, False, False)
 
 
+async def change_count(db: aiosqlite.Connection) -> int:
+    # Writes to job and job_status so far, maintained by triggers in schema.sql
+    async with db.execute("SELECT value FROM change_counter WHERE id=1;") as cursor:
+        return (await cursor.fetchone())[0]
+
+
+class Writer:
+    # Owns the only write connection. Writes are queued by callers and applied
+    # in group commits: a batch is flushed when it reaches max_batch writes or
+    # max_delay seconds after its first write, whichever comes first.
+    def __init__(self, max_batch: int = 64, max_delay: float = 0.005,
+                 busy_timeout: float = 5.0):
+        self.max_batch, self.max_delay = max_batch, max_delay
+        # Seconds to wait for a write lock held by another process
+        self.busy_timeout = busy_timeout
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue[tuple[WriteOp, asyncio.Future] | None] = asyncio.Queue()
+        self.commits = 0
+        self.task = asyncio.create_task(self._run())
+
+    async def submit(self, op: WriteOp) -> Any:
+        future = self.loop.create_future()
+        self.queue.put_nowait((op, future))
+        return await future
+
+    async def stop(self) -> None:
+        # Pending writes queued before stop() are still applied
+        if not self.task.done():
+            self.queue.put_nowait(None)
+        await asyncio.gather(self.task, return_exceptions=True)
+
+    async def _run(self) -> None:
+        try:
+            async with database_connection() as db:
+                # WAL lets the readers run while the writer holds the write lock
+                await db.execute("PRAGMA journal_mode=WAL;")
+                await db.execute("PRAGMA synchronous=NORMAL;")
+                await db.execute(f"PRAGMA busy_timeout={int(self.busy_timeout * 1000)};")
+                stopping = False
+                while not stopping:
+                    if (item := await self.queue.get()) is None:
+                        break
+                    batch = [item]
+                    deadline = self.loop.time() + self.max_delay
+                    while len(batch) < self.max_batch:
+                        try:
+                            item = self.queue.get_nowait()
+                        except asyncio.QueueEmpty:
+                            try:
+                                item = await asyncio.wait_for(
+                                    self.queue.get(), deadline - self.loop.time()
+                                )
+                            except asyncio.TimeoutError:
+                                break
+                        if item is None:
+                            stopping = True
+                            break
+                        batch.append(item)
+                    await self._apply(db, batch)
+        except BaseException as e:
+            # Don't leave callers waiting forever on a writer that is gone
+            error = e if isinstance(e, Exception) else aiosqlite.Error("Writer stopped")
+            while not self.queue.empty():
+                if (item := self.queue.get_nowait()) is not None and not item[1].done():
+                    item[1].set_exception(error)
+            raise
+
+    async def _apply(self, db: aiosqlite.Connection,
+                     batch: list[tuple[WriteOp, asyncio.Future]]) -> None:
+        start = self.loop.time()
+        try:
+            results = []
+            await db.execute("BEGIN IMMEDIATE;")
+            # Holding the write lock, so the counter only moves by this batch
+            before = await change_count(db)
+            for op, future in batch:
+                # A failing write only rolls back itself, not the whole batch
+                await db.execute("SAVEPOINT write_op;")
+                try:
+                    results.append((future, await op(db), None))
+                except Exception as e:
+                    await db.execute("ROLLBACK TO write_op;")
+                    results.append((future, None, e))
+                await db.execute("RELEASE write_op;")
+            after = await change_count(db)
+            await db.commit()
+            self.commits += 1
+            ACTIVE_JOBS.advance(before, after)
+            duration = self.loop.time() - start
+            logger.debug("Committed %d writes in %.4fs", len(batch), duration,
+                         extra={"duration": duration})
+        except aiosqlite.Error as e:
+            # e.g. database is locked by another process or the commit failed,
+            # nothing of the batch was saved so every caller gets the error
+            logger.exception("Something went wrong while writing %d writes", len(batch))
+            if db.in_transaction:
+                try:
+                    await db.rollback()
+                except aiosqlite.Error:
+                    logger.exception("Something went wrong while rolling back")
+            results = [(future, None, e) for _, future in batch]
+        for future, result, error in results:
+            if future.done():  # Caller gave up waiting
+                continue
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+_writer: Writer | None = None
+
+
+def start_writer(**kwargs) -> Writer:
+    global _writer
+    if (_writer is None or _writer.task.done()
+            or _writer.loop is not asyncio.get_running_loop()):
+        _writer = Writer(**kwargs)
+    return _writer
+
+
+async def stop_writer() -> None:
+    global _writer
+    if _writer is not None:
+        writer, _writer = _writer, None
+        await writer.stop()
+
+
+async def write(op: WriteOp) -> Any:
+    # Run op(connection) on the writer, result is available once committed
+    return await start_writer().submit(op)
+
+
 async def create_table():
     logger.info("Creating table if not exist")
     async with database_connection() as db:
-        with open("./schema.sql") as fr:
+        with open(SCHEMA_PATH) as fr:
             await db.executescript(fr.read())
 
 
-async def insert_job(title: str, uid: str, end_date: str, posted_date: str) -> JobDetailFull:
-    logger.info("Insert %s %s %s", title, end_date, posted_date)
+async def migrate() -> int:
+    # Bring an existing database up to date, returns number of migrations run
+    await create_table()
     async with database_connection() as db:
+        async with db.execute("PRAGMA user_version;") as cursor:
+            version = (await cursor.fetchone())[0]
+        for i, stmt in enumerate(MIGRATIONS[version:], start=version + 1):
+            logger.info("Apply migration %d", i)
+            try:
+                await db.execute(stmt)
+            except sqlite3.OperationalError as e:
+                # Tables fresh from schema.sql already have the new columns
+                if "duplicate column" not in str(e):
+                    raise
+            await db.execute(f"PRAGMA user_version={i};")
+        await db.commit()
+        return len(MIGRATIONS) - version
+
+
+async def insert_job(title: str, uid: str, end_date: str, posted_date: str,
+                     fingerprint: str | None = None) -> JobDetailFull:
+    logger.info("Insert %s %s %s", title, end_date, posted_date)
+    fingerprint = fingerprint or job_fingerprint(title, end_date, posted_date)
+
+    async def op(db: aiosqlite.Connection) -> JobDetailFull:
         result: tuple[int] = await db.execute_insert(
-            "INSERT INTO job(title, uid, end_date, posted_date) VALUES "
-            f"('{title}', '{uid}', DATE('{end_date}'), DATE('{posted_date}'));"
+            "INSERT INTO job(title, uid, end_date, posted_date, fingerprint) VALUES "
+            "(?, ?, DATE(?), DATE(?), ?);",
+            (title, uid, str(end_date), str(posted_date), fingerprint)
         )
-        try:
-            await db.commit()
-            return JobDetailFull(result[0], title, end_date, posted_date,
-                                 False, False, False)
-        except aiosqlite.Error:
-            logger.exception("Something went wrong while inserting")
+        return JobDetailFull(result[0], title, end_date, posted_date,
+                             False, False, False)
+    if job := await write(op):
+        ACTIVE_JOBS.add_job(job.id, title, end_date, posted_date, new=True)
+    return job
+
+
+async def update_jobs(
+    jobs: list[tuple[int, str, str, str, str]]
+) -> list[JobDetailFull]:
+    # Rows of (id, title, end_date, posted_date, fingerprint), all in one write
+    logger.info("Update %d jobs", len(jobs))
+
+    async def op(db: aiosqlite.Connection) -> list[JobDetailFull]:
+        await db.executemany(
+            "UPDATE job SET title=?, end_date=DATE(?), posted_date=DATE(?), "
+            "fingerprint=? WHERE id=?;",
+            [(title, str(end_date), str(posted_date), fingerprint, job_id)
+             for job_id, title, end_date, posted_date, fingerprint in jobs]
+        )
+        return [JobDetailFull(job_id, title, end_date, posted_date, False, False, False)
+                for job_id, title, end_date, posted_date, _ in jobs]
+    if not jobs:
+        return []
+    updated = await write(op)
+    for job in updated or ():
+        ACTIVE_JOBS.add_job(job.id, job.title, job.end_date, job.posted_date)
+    return updated
 
 
 async def insert_student(chat_id: str | int, username: str, full_name: str) -> StudentDetail:
-    async with database_connection() as db:
+    async def op(db: aiosqlite.Connection) -> StudentDetail:
         result: tuple[int] = await db.execute_insert(
             "INSERT INTO student(chat_id, username, full_name) VALUES "
             f"('{chat_id}', '{username}', '{full_name}')"
         )
-        try:
-            await db.commit()
-            return StudentDetail(result[0], chat_id, username, full_name)
-        except aiosqlite.Error:
-            logger.exception("Something went wrong while inserting")
+        return StudentDetail(result[0], chat_id, username, full_name)
+    return await write(op)
 
 
 async def fetch_one_job(chat_id: int, job_id: int) -> JobDetailFull:
-    logger.info("Get details for id-%d", job_id)
+    logger.info("Get details for id-%d", job_id,
+                extra={"chat_id": chat_id, "job_id": job_id})
     student = await fetch_one_student(chat_id)
     async with database_connection() as db:
         db.row_factory = job_full_detail_factory
@@ -86,7 +300,7 @@ async def fetch_one_job(chat_id: int, job_id: int) -> JobDetailFull:
 
 
 async def fetch_one_student(chat_id: int | str) -> StudentDetail:
-    logger.info("Get details of student-%s", chat_id)
+    logger.info("Get details of student-%s", chat_id, extra={"chat_id": chat_id})
     async with database_connection() as db:
         db.row_factory = lambda _, row: StudentDetail(*row)
         async with db.execute(
@@ -104,13 +318,16 @@ async def fetch_all_jobs(
             f"AND JS.student_id={student_id} "
             f"WHERE 1=1 ")
     if only_interested:
-        logger.info("Get all interested jobs for %d", student_id)
+        logger.info("Get all interested jobs for %d", student_id,
+                    extra={"student_id": student_id})
         stmt += " AND JS.interested=TRUE"
     elif only_applied:
-        logger.info("Get all applied jobs for %d", student_id)
+        logger.info("Get all applied jobs for %d", student_id,
+                    extra={"student_id": student_id})
         stmt += " AND JS.applied=TRUE"
     elif only_skip:
-        logger.info("Get all skipped jobs for %d", student_id)
+        logger.info("Get all skipped jobs for %d", student_id,
+                    extra={"student_id": student_id})
         stmt += " AND JS.skip=TRUE"
     stmt += " ORDER BY JOB.posted_date DESC LIMIT 20;"
     async with database_connection() as db:
@@ -121,39 +338,115 @@ async def fetch_all_jobs(
 async def fetch_active_jobs(
     student_id: int, near_end_date: bool = False
 ) -> list[JobDetailShort]:
+    if near_end_date:
+        logger.info("Get end_date jobs", extra={"student_id": student_id})
+    else:
+        logger.info("Get active jobs", extra={"student_id": student_id})
+    index = await load_index()
+    return [JobDetailShort(job.id, job.title)
+            for job in index.active(student_id, near_end_date)]
+
+
+async def fetch_active_jobs_sql(
+    student_id: int, near_end_date: bool = False
+) -> list[JobDetailShort]:
+    # Same as fetch_active_jobs() straight from SQLite, used to verify the index
     stmt = ("SELECT JOB.id, JOB.title FROM job JOB "
             "LEFT JOIN job_status JS ON "
             f"(JS.job_id = JOB.id AND JS.student_id={student_id}) "
             "WHERE ((JS.skip=FALSE AND JS.applied=FALSE) OR JS.id IS NULL) "
             "AND JOB.end_date >= DATE('now', 'localtime') ")
     if near_end_date:
-        logger.info("Get end_date jobs")
         stmt += "AND (JULIANDAY(JOB.end_date) - JULIANDAY('now', 'localtime')) < 1.2 "
-    else:
-        logger.info("Get active jobs")
     async with database_connection() as db:
         # Convert the rows to list[namedtuple] instead of list[tuple]
         db.row_factory = job_short_detail_factory
         return await db.execute_fetchall(
-            stmt + " ORDER BY JOB.posted_date DESC;"
+            stmt + " ORDER BY JOB.posted_date DESC, JOB.id DESC;"
         )
 
 
+async def load_index(force: bool = False) -> ActiveJobsIndex:
+    # (Re)load ACTIVE_JOBS from SQLite when another process changed the jobs or
+    # statuses, which is noticed through change_counter
+    if not (force or ACTIVE_JOBS.needs_check):
+        return ACTIVE_JOBS
+    async with database_connection() as db:
+        if not force and ACTIVE_JOBS.loaded:
+            if await change_count(db) == ACTIVE_JOBS.counter:
+                ACTIVE_JOBS.checked_at = time.monotonic()
+                return ACTIVE_JOBS
+            logger.info("Jobs changed by another process, reload the index")
+        while True:
+            version = ACTIVE_JOBS.version
+            # One read transaction so the counter matches the rows
+            await db.execute("BEGIN;")
+            counter = await change_count(db)
+            jobs = await db.execute_fetchall(
+                "SELECT id, title, end_date, posted_date FROM job "
+                "WHERE end_date >= DATE('now', 'localtime');"
+            )
+            statuses = await db.execute_fetchall(
+                "SELECT JS.student_id, JS.job_id, JS.applied, JS.skip FROM job_status JS "
+                "JOIN job JOB ON JOB.id = JS.job_id "
+                "WHERE JOB.end_date >= DATE('now', 'localtime') "
+                "AND (JS.applied=TRUE OR JS.skip=TRUE);"
+            )
+            await db.rollback()
+            # A write landed while reading, read again to not miss it
+            if ACTIVE_JOBS.version == version:
+                break
+    logger.info("Loaded %d active jobs and %d statuses", len(jobs), len(statuses))
+    ACTIVE_JOBS.load(counter, jobs, statuses)
+    return ACTIVE_JOBS
+
+
+async def verify_index() -> list[int]:
+    # Ids of students for whom ACTIVE_JOBS disagrees with SQLite. Only meaningful
+    # in the process serving from the index, i.e. the bot (/checkindex).
+    index = await load_index()
+    async with database_connection() as db:
+        student_ids = [row[0] for row in await db.execute_fetchall(
+            "SELECT id FROM student UNION SELECT student_id FROM job_status;"
+        )]
+    mismatches = []
+    for student_id in student_ids:
+        for near_end_date in (False, True):
+            expected = await fetch_active_jobs_sql(student_id, near_end_date)
+            actual = [(job.id, job.title)
+                      for job in index.active(student_id, near_end_date)]
+            if actual != [tuple(job) for job in expected]:
+                logger.warning("Index mismatch for student-%d", student_id,
+                               extra={"student_id": student_id})
+                mismatches.append(student_id)
+                break
+    return mismatches
+
+
 async def update_job_status_field(
     chat_id: int, job_id: int, field: str, value: str | bool
 ) -> None:
     student = await fetch_one_student(chat_id)
-    async with database_connection() as db:
-        if await job_status_exists(student.id, job_id):
+
+    async def op(db: aiosqlite.Connection) -> None:
+        # Checked on the writer connection so concurrent presses can't both insert
+        async with db.execute(
+            "SELECT EXISTS(SELECT 1 FROM job_status "
+            f"WHERE student_id={student.id} AND job_id={job_id} LIMIT 1);"
+        ) as cursor:
+            exists = (await cursor.fetchone())[0] == 1
+        if exists:
             logger.info("Update job_status field-%s=>%s by %d for job-%d",
-                        field, value, chat_id, job_id)
+                        field, value, chat_id, job_id,
+                        extra={"chat_id": chat_id, "job_id": job_id})
             await db.execute(
                 f"UPDATE job_status SET {field}={value} "
                 f"WHERE student_id={student.id} AND job_id={job_id};"
             )
         else:
             logger.info("Insert job_status field-%s=>%s by %d for job-%d",
-                        field, value, chat_id, job_id)
+                        field, value, chat_id, job_id,
+                        extra={"chat_id": chat_id, "job_id": job_id})
             await db.execute(
                 f"INSERT INTO job_status(student_id, job_id, {field}) VALUES "
                 f"({student.id}, {job_id}, {value})"
@@ -163,22 +456,16 @@ async def update_job_status_field(
                 "UPDATE job_status SET applied_on=DATETIME('now', 'localtime') "
                 f"WHERE student_id={student.id} AND job_id={job_id};"
             )
-        try:
-            await db.commit()
-        except aiosqlite.Error:
-            logger.exception("Error while updating field-%s=>%s by %d for job-%d",
-                             field, value, chat_id, job_id)
+        return True
+    if await write(op):
+        ACTIVE_JOBS.set_status(student.id, job_id, field, value)
 
 
 async def update_student_field(chat_id: str | int, field: str, value: bool) -> None:
-    async with database_connection() as db:
+    async def op(db: aiosqlite.Connection) -> None:
         await db.execute(f"UPDATE student SET {field}={int(value)} "
                          f"WHERE chat_id='{chat_id}';")
-        try:
-            await db.commit()
-        except aiosqlite.Error:
-            logger.exception("Error while updating field-notify for chat_id=%s to %s",
-                             chat_id, value)
+    await write(op)
 
 
 async def job_exists(uid: str) -> bool:
@@ -189,6 +476,22 @@ async def job_exists(uid: str) -> bool:
         return (await result.fetchone())[0] == 1
 
 
+async def fetch_job_fingerprints(uids: list[str]) -> dict[str, tuple[int, str | None]]:
+    # uid => (id, fingerprint) of the saved jobs among uids
+    saved = {}
+    async with database_connection() as db:
+        # Stay below SQLite's limit of host parameters per statement
+        for i in range(0, len(uids), 500):
+            chunk = uids[i:i + 500]
+            async with db.execute(
+                "SELECT uid, id, fingerprint FROM job "
+                f"WHERE uid IN ({', '.join('?' * len(chunk))});", chunk
+            ) as cursor:
+                async for uid, job_id, fingerprint in cursor:
+                    saved[uid] = (job_id, fingerprint)
+    return saved
+
+
 async def student_exists(chat_id: str | int) -> bool:
     async with database_connection() as db:
         result = await db.execute(
@@ -235,5 +538,12 @@ async def job_status_exists(student_id: int, job_id: int) -> bool:
         return (await result.fetchone())[0] == 1
 
 
+async def dump_table(table: str) -> tuple[list[str], list[tuple]]:
+    # Column names and all rows of the table, used by `tnp export`
+    async with database_connection() as db:
+        async with db.execute(f"SELECT * FROM {table} ORDER BY id;") as cursor:
+            return [col[0] for col in cursor.description], await cursor.fetchall()
+
+
 if __name__ == "__main__":
     asyncio.run(create_table())
@@ -0,0 +1,133 @@
+import asyncio
+import random
+import time
+
+from importlib.util import find_spec
+
+import httpx
+
+from logger import logger
+
+HEADERS = {
+    "User-Agent": ("Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+                   "(KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36"),
+}
+# HTTP/2 needs the optional `h2` package (pip install httpx[http2])
+HTTP2 = find_spec("h2") is not None
+TIMEOUT = httpx.Timeout(connect=10.0, read=30.0, write=10.0, pool=5.0)
+LIMITS = httpx.Limits(max_connections=10, max_keepalive_connections=5,
+                      keepalive_expiry=30.0)
+
+RETRIES = 3
+BACKOFF_BASE, BACKOFF_MAX = 0.5, 8.0
+# Status codes worth retrying, everything else is returned as is
+RETRY_STATUS = frozenset((429, 500, 502, 503, 504))
+
+
+class CircuitOpenError(Exception):
+    """Raised when the portal failed too often and requests are paused."""
+
+
+class CircuitBreaker:
+    # Closed: requests pass. Open: requests fail fast until reset_timeout has
+    # passed. Half-open: one trial request decides whether to close or re-open.
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 300.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_request(self) -> None:
+        if self.state == "open":
+            raise CircuitOpenError(
+                f"Portal circuit open after {self.failures} failures, "
+                f"retry in {self.reset_timeout - (time.monotonic() - self.opened_at):.0f}s"
+            )
+
+    def record_success(self) -> None:
+        if self.opened_at is not None:
+            logger.info("Portal circuit closed")
+        self.failures, self.opened_at = 0, None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == "half-open" or self.failures >= self.failure_threshold:
+            logger.warning("Portal circuit opened after %d failures", self.failures)
+            self.opened_at = time.monotonic()
+
+
+# Shared across scraper runs so that repeated failing runs back off as well
+PORTAL_BREAKER = CircuitBreaker()
+
+
+def backoff_delay(attempt: int) -> float:
+    # Exponential backoff with full jitter, attempt starts from 0
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+async def _log_request(request: httpx.Request) -> None:
+    request.extensions["tnp_start"] = time.perf_counter()
+
+
+async def _log_response(response: httpx.Response) -> None:
+    request = response.request
+    duration = time.perf_counter() - request.extensions.get("tnp_start", time.perf_counter())
+    logger.info("%s %s %d %s in %.3fs", request.method, request.url,
+                response.status_code, response.http_version, duration,
+                extra={"duration": duration})
+
+
+def create_client(**kwargs) -> httpx.AsyncClient:
+    # Client with tuned pool, timeouts and per-request timing logs
+    kwargs.setdefault("headers", HEADERS)
+    kwargs.setdefault("timeout", TIMEOUT)
+    kwargs.setdefault("limits", LIMITS)
+    kwargs.setdefault("http2", HTTP2)
+    kwargs.setdefault("event_hooks", {"request": [_log_request],
+                                      "response": [_log_response]})
+    return httpx.AsyncClient(**kwargs)
+
+
+async def request(
+    client: httpx.AsyncClient, method: str, url: str, *,
+    retries: int | None = None, breaker: CircuitBreaker = PORTAL_BREAKER, **kwargs
+) -> httpx.Response:
+    # Only GET is retried by default, other methods are not idempotent
+    if retries is None:
+        retries = RETRIES if method.upper() == "GET" else 0
+    for attempt in range(retries + 1):
+        breaker.before_request()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.TransportError as e:
+            breaker.record_failure()
+            if attempt == retries:
+                raise
+            logger.warning("%s %s failed with %r", method, url, e)
+        else:
+            if response.status_code not in RETRY_STATUS:
+                breaker.record_success()
+                return response
+            breaker.record_failure()
+            if attempt == retries:
+                return response.raise_for_status()
+            logger.warning("%s %s returned %d", method, url, response.status_code)
+        delay = backoff_delay(attempt)
+        logger.info("Retry %d/%d in %.2fs", attempt + 1, retries, delay)
+        await asyncio.sleep(delay)
+
+
+async def get(client: httpx.AsyncClient, url: str, **kwargs) -> httpx.Response:
+    return await request(client, "GET", url, **kwargs)
+
+
+async def post(client: httpx.AsyncClient, url: str, **kwargs) -> httpx.Response:
+    return await request(client, "POST", url, **kwargs)
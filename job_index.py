@@ -0,0 +1,155 @@
+import datetime as dt
+import time
+
+from bisect import insort
+from collections import namedtuple
+
+IndexedJob = namedtuple("IndexedJob", ("id", "title", "end_date", "posted_date"))
+# Status fields read by active(), the others are not kept
+STATUS_FIELDS = ("applied", "skip")
+# Same window as JULIANDAY(end_date) - JULIANDAY('now', 'localtime') < 1.2
+NEAR_END_DATE = dt.timedelta(days=1.2)
+
+
+def as_date(value: dt.date | str) -> dt.date:
+    return value if isinstance(value, dt.date) else dt.date.fromisoformat(str(value))
+
+
+def _order_key(job: IndexedJob) -> tuple[int, int]:
+    # posted_date DESC, id DESC
+    return -job.posted_date.toordinal(), -job.id
+
+
+class ActiveJobsIndex:
+    # In-process copy of the live jobs (end_date >= today) ordered by posted_date
+    # plus, for each status field, a bitset per student where bit N - base is set
+    # when the field is TRUE for live job N. base is the lowest live job id, so a
+    # bitset is only as wide as the span of live ids. Kept in sync by the write
+    # paths in database, `counter` is the change_counter value it reflects.
+    def __init__(self, check_interval: float = 1.0):
+        # Seconds between checks of change_counter for writes by other processes
+        self.check_interval = check_interval
+        self.clear()
+
+    def clear(self) -> None:
+        self.counter: int | None = None
+        self.checked_at = float("-inf")
+        self.pruned_on = dt.date.today()
+        self.version = 0
+        self.base = 0
+        self.jobs: dict[int, IndexedJob] = {}
+        self.ordered: list[IndexedJob] = []
+        self.live_mask = 0
+        self.status: dict[str, dict[int, int]] = {field: {} for field in STATUS_FIELDS}
+
+    @property
+    def loaded(self) -> bool:
+        return self.counter is not None
+
+    @property
+    def needs_check(self) -> bool:
+        return not self.loaded or time.monotonic() - self.checked_at > self.check_interval
+
+    def invalidate(self) -> None:
+        # Force a reload on the next lookup
+        self.counter = None
+
+    def advance(self, before: int, after: int) -> None:
+        # Writes of this process moved change_counter from before to after
+        if self.counter == before:
+            self.counter = after
+
+    def load(self, counter: int, jobs: list[tuple], statuses: list[tuple]) -> None:
+        # jobs: live (id, title, end_date, posted_date)
+        # statuses: (student_id, job_id, applied, skip) of the live jobs
+        version = self.version
+        self.clear()
+        self.version = version
+        # Lowest id first, it becomes the base
+        for job in sorted(jobs):
+            self.add_job(*job, new=True)
+        for student_id, job_id, *values in statuses:
+            for field, value in zip(STATUS_FIELDS, values):
+                self.set_status(student_id, job_id, field, value)
+        self.counter, self.checked_at = counter, time.monotonic()
+
+    def _bit(self, job_id: int) -> int:
+        return 1 << (job_id - self.base)
+
+    def add_job(self, job_id: int, title: str, end_date, posted_date,
+                new: bool = False) -> None:
+        # Insert or replace, expired jobs are dropped. `new` jobs have no
+        # statuses yet, any other job that was not live needs a reload.
+        self.version += 1
+        was_live = job_id in self.jobs
+        if was_live:
+            self.ordered.remove(self.jobs.pop(job_id))
+            self.live_mask &= ~self._bit(job_id)
+        job = IndexedJob(job_id, title, as_date(end_date), as_date(posted_date))
+        if job.end_date < dt.date.today():
+            return
+        if not (was_live or new) or (self.jobs and job_id < self.base):
+            # An expired job got live again, its statuses were never loaded
+            self.invalidate()
+            return
+        if not self.jobs and not any(self.status.values()):
+            self.base = job_id
+        self.jobs[job_id] = job
+        insort(self.ordered, job, key=_order_key)
+        self.live_mask |= self._bit(job_id)
+
+    def set_status(self, student_id: int, job_id: int, field: str, value) -> None:
+        self.version += 1
+        if field not in self.status or job_id not in self.jobs:
+            return
+        bits = self.status[field]
+        if value in (True, 1, "1") or str(value).upper() == "TRUE":
+            bits[student_id] = bits.get(student_id, 0) | self._bit(job_id)
+        elif bits.get(student_id, 0) & self._bit(job_id):
+            if not (value := bits[student_id] & ~self._bit(job_id)):
+                del bits[student_id]
+            else:
+                bits[student_id] = value
+
+    def has_status(self, student_id: int, job_id: int, field: str) -> bool:
+        return job_id in self.jobs and bool(
+            self.status[field].get(student_id, 0) & self._bit(job_id)
+        )
+
+    def prune(self, today: dt.date) -> None:
+        # Drop the jobs whose end_date has passed with their status bits, then
+        # shift every bitset down to the new lowest live id
+        self.pruned_on = today
+        expired = [job for job in self.ordered if job.end_date < today]
+        if not expired:
+            return
+        for job in expired:
+            del self.jobs[job.id]
+            self.ordered.remove(job)
+            self.live_mask &= ~self._bit(job.id)
+        base = min(self.jobs, default=self.base)
+        shift, self.base = base - self.base, base
+        self.live_mask >>= shift
+        for bits in self.status.values():
+            for student_id, value in list(bits.items()):
+                if value := (value >> shift) & self.live_mask:
+                    bits[student_id] = value
+                else:
+                    del bits[student_id]
+
+    def active(
+        self, student_id: int, near_end_date: bool = False, now: dt.datetime | None = None
+    ) -> list[IndexedJob]:
+        # Live jobs neither applied nor skipped by the student
+        now = now or dt.datetime.now()
+        if self.pruned_on != now.date():
+            self.prune(now.date())
+        mask = self.live_mask & ~(self.status["applied"].get(student_id, 0) |
+                                  self.status["skip"].get(student_id, 0))
+        if not mask:
+            return []
+        jobs = [job for job in self.ordered if mask & self._bit(job.id)]
+        if near_end_date:
+            jobs = [job for job in jobs
+                    if dt.datetime.combine(job.end_date, dt.time()) - now < NEAR_END_DATE]
+        return jobs
@@ -0,0 +1,67 @@
+import asyncio
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+from lxml import html
+
+import constants
+from logger import logger
+
+# title, uid, end_date, posted_date
+Row = tuple[str, str, str, str]
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def parse_job_rows(content: bytes, encoding: str = "utf-8") -> list[Row]:
+    # Runs in a worker process, so it takes raw bytes and returns plain tuples
+    # to keep what crosses the process boundary small and cheap to pickle.
+    # The bytes are decoded with the response charset, left to itself lxml
+    # falls back to Latin-1 and garbles non-ASCII titles.
+    html_root = html.fromstring(content, parser=html.HTMLParser(encoding=encoding))
+    jobs_tbody_ele = html_root.find(".//table[@id='job-listings']/tbody")
+    rows = []
+    for job in jobs_tbody_ele.findall(".//tr"):
+        title_ele, end_date_ele, posted_date_ele, dates_ele = job.findall(".//td")
+        # Date given as DD/MM/YYYY, reformat as YYYY-MM-DD
+        end_date = "-".join(end_date_ele.text.strip().split("/")[::-1])
+        posted_date = "-".join(posted_date_ele.text.strip().split("/")[::-1])
+        uid = dates_ele.find(".//a").get("href").rsplit("/", 1)[1]
+        rows.append((title_ele.text.strip(), uid, end_date, posted_date))
+    return rows
+
+
+def parse_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn, forking the bot would copy its logging and sqlite threads' state
+        _pool = ProcessPoolExecutor(constants.PARSE_WORKERS, mp_context=get_context("spawn"))
+    return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    if _pool is not None:
+        pool, _pool = _pool, None
+        pool.shutdown(cancel_futures=True)
+
+
+async def parse_listings(content: bytes, encoding: str = "utf-8") -> list[Row]:
+    # Small pages are parsed inline, sending them to a worker costs more
+    if constants.PARSE_WORKERS < 1 or len(content) <= constants.PARSE_INLINE_MAX_BYTES:
+        return parse_job_rows(content, encoding)
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(parse_pool(), parse_job_rows, content, encoding)
+    except BrokenProcessPool:
+        # A worker died, the executor is unusable from now on. Start a new one
+        # and retry once, a page that breaks it twice fails this scrape only.
+        logger.warning("Listings parser pool broke, restart it and retry")
+        shutdown_pool()
+        try:
+            return await loop.run_in_executor(parse_pool(), parse_job_rows, content, encoding)
+        except BrokenProcessPool:
+            shutdown_pool()
+            raise
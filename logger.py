@@ -1,10 +1,115 @@
+import atexit
+import copy
+import json
 import logging
+import queue
 import sys
+import time
+
+from logging.handlers import QueueHandler, QueueListener
+
+import constants
+
+# Record attributes copied into JSON output when a call site passes them in extra
+JSON_FIELDS = ("chat_id", "job_id", "student_id", "duration", "suppressed")
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": self.formatTime(record, "%Y-%m-%d %H:%M:%S"),
+            "level": record.levelname,
+            "where": f"{record.module}.{record.funcName}",
+            "message": record.getMessage(),
+        }
+        for field in JSON_FIELDS:
+            if (value := getattr(record, field, None)) is not None:
+                data[field] = value
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    # Token bucket per call site (file, line) for records below WARNING: each
+    # site may log `burst` records at once and `rate` records per second after.
+    # The next record let through carries the number of dropped ones.
+    def __init__(self, rate: float, burst: int = 5):
+        super().__init__()
+        self.rate, self.burst = rate, burst
+        self.buckets: dict[tuple[str, int], list[float]] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate <= 0 or record.levelno >= logging.WARNING:
+            return True
+        now = time.monotonic()
+        # [tokens, last refill, suppressed]
+        bucket = self.buckets.setdefault((record.pathname, record.lineno),
+                                         [self.burst, now, 0])
+        bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if bucket[0] < 1:
+            bucket[2] += 1
+            return False
+        bucket[0] -= 1
+        if bucket[2]:
+            record.suppressed, bucket[2] = bucket[2], 0
+        return True
+
+
+class LocalQueueHandler(QueueHandler):
+    # The listener runs in this process, so only the message args are merged
+    # here (they may be mutated later). Unlike QueueHandler.prepare() the record
+    # is not formatted, keeping exc_info and extra fields for the real formatter.
+    def handle(self, record: logging.LogRecord) -> bool:
+        # Settings are read on the first record, importing this module must not
+        # load .env (see constants)
+        if not configured:
+            configure()
+        return super().handle(record)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        return record
+
+
+class TextFormatter(logging.Formatter):
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        text = super().formatMessage(record)
+        if suppressed := getattr(record, "suppressed", None):
+            text += f" ({suppressed} similar suppressed)"
+        return text
+
+
+def build_formatter(fmt: str) -> logging.Formatter:
+    if fmt == "json":
+        return JsonFormatter()
+    return TextFormatter(
+        "%(asctime)s [%(levelname)s] %(module)s.%(funcName)s: %(message)s", "%Y-%m-%d %H:%M:%S"
+    )
+
+
+def configure(fmt: str | None = None, rate: float | None = None, burst: int | None = None):
+    # Switch output format and rate limit at runtime, defaults come from constants
+    global configured
+    configured = True
+    handler.setFormatter(build_formatter(fmt or constants.LOG_FORMAT))
+    rate_limit.rate = constants.LOG_RATE_LIMIT if rate is None else rate
+    rate_limit.burst = constants.LOG_BURST if burst is None else burst
+    rate_limit.buckets.clear()
+
 
 logger = logging.getLogger("__name__")
 logger.setLevel(logging.INFO)
+# Records are only filtered and queued on the caller's thread (usually the
+# event loop), formatting and the stdout write happen on the listener thread.
 handler = logging.StreamHandler(sys.stdout)
-handler.setFormatter(logging.Formatter(
-    "%(asctime)s [%(levelname)s] %(module)s.%(funcName)s: %(message)s", "%Y-%m-%d %H:%M:%S"
-))
-logger.addHandler(handler)
+rate_limit = RateLimitFilter(0)
+queue_handler = LocalQueueHandler(queue.SimpleQueue())
+queue_handler.addFilter(rate_limit)
+logger.addHandler(queue_handler)
+listener = QueueListener(queue_handler.queue, handler, respect_handler_level=True)
+configured = False
+listener.start()
+atexit.register(listener.stop)
@@ -4,6 +4,7 @@ CREATE TABLE IF NOT EXISTS job(
   uid VARCHAR(255) UNIQUE NOT NULL,
   end_date DATE,
   posted_date DATE,
+  fingerprint VARCHAR(64),        -- Hash of the scraped fields to detect updates
   created_at DATETIME DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -30,3 +31,23 @@ CREATE TABLE IF NOT EXISTS job_status(
   FOREIGN KEY(student_id) REFERENCES student(id),
   FOREIGN KEY(job_id) REFERENCES job(id)
 );
+
+-- Bumped by every write to job and job_status, lets a process notice that
+-- another one changed them (see database.load_index)
+CREATE TABLE IF NOT EXISTS change_counter(
+  id INTEGER NOT NULL PRIMARY KEY CHECK (id = 1),
+  value INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO change_counter(id, value) VALUES (1, 0);
+CREATE TRIGGER IF NOT EXISTS job_insert_count AFTER INSERT ON job
+BEGIN UPDATE change_counter SET value=value + 1 WHERE id=1; END;
+CREATE TRIGGER IF NOT EXISTS job_update_count AFTER UPDATE ON job
+BEGIN UPDATE change_counter SET value=value + 1 WHERE id=1; END;
+CREATE TRIGGER IF NOT EXISTS job_delete_count AFTER DELETE ON job
+BEGIN UPDATE change_counter SET value=value + 1 WHERE id=1; END;
+CREATE TRIGGER IF NOT EXISTS job_status_insert_count AFTER INSERT ON job_status
+BEGIN UPDATE change_counter SET value=value + 1 WHERE id=1; END;
+CREATE TRIGGER IF NOT EXISTS job_status_update_count AFTER UPDATE ON job_status
+BEGIN UPDATE change_counter SET value=value + 1 WHERE id=1; END;
+CREATE TRIGGER IF NOT EXISTS job_status_delete_count AFTER DELETE ON job_status
+BEGIN UPDATE change_counter SET value=value + 1 WHERE id=1; END;
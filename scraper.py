@@ -1,69 +1,126 @@
 import asyncio
 import httpx
-import os
 
 from collections import namedtuple
 
-from lxml import html
 from typing import Generator
 
-from database import job_exists, insert_job, JobDetailFull
+import constants
+import http_client
+import listings
+import snapshots
+
+from database import (fetch_job_fingerprints, insert_job, job_fingerprint, update_jobs,
+                      JobDetailFull)
 from logger import logger
 
-HEADERS = {
-    "User-Agent": ("Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
-                   "(KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36"),
-}
-BASE_URL = os.environ["URL"]
+# Relative to constants.BASE_URL, which is only read when scraping
 LOGIN_GET_URL, LOGIN_POST_URL, LOGOUT_URL = (
-    f"{BASE_URL}/login.html", f"{BASE_URL}/auth/login.html",
-    f"{BASE_URL}/logout.html"
+    "/login.html", "/auth/login.html", "/logout.html"
 )
-JOBS_URL = f"{BASE_URL}/applyjobs.html"
-PAYLOAD = {"identity": os.environ["USERNAME"],
-           "password": os.environ["PASSWORD"],
-           "submit": "Login", "txtcentrenm": ""}
+JOBS_URL = "/applyjobs.html"
+
+
+class Job(namedtuple("Job", ("title", "uid", "end_date", "posted_date"))):
+    __slots__ = ()
+
+    @property
+    def fingerprint(self) -> str:
+        return job_fingerprint(self.title, self.end_date, self.posted_date)
+
+
+# new: jobs not saved yet. changed and backfill: (id, job) of saved jobs whose
+# fingerprint differs, backfill ones were saved before fingerprints existed.
+JobChanges = namedtuple("JobChanges", ("new", "changed", "backfill"))
+ScrapeResult = namedtuple("ScrapeResult", ("new", "updated"))
+
 
-Job = namedtuple("Job", ("title", "uid", "end_date", "posted_date"))
+def login_payload() -> dict[str, str]:
+    return {"identity": constants.USERNAME, "password": constants.PASSWORD,
+            "submit": "Login", "txtcentrenm": ""}
 
 
-async def get_and_save_new_jobs() -> list[JobDetailFull]:
+async def get_and_save_new_jobs() -> ScrapeResult:
     logger.info("Get and save/update new jobs")
-    new_jobs = []
-    async for job in extract_job_details():
-        if not await job_exists(job.uid):
-            new_jobs.append(await insert_job(
-                job.title, job.uid, job.end_date, job.posted_date
-            ))
-    return new_jobs
+    return await save_jobs([job async for job in extract_job_details()])
+
+
+async def diff_jobs(jobs: list[Job]) -> JobChanges:
+    # Compare the scraped jobs with the saved ones by fingerprint in bulk
+    saved = await fetch_job_fingerprints([job.uid for job in jobs])
+    changes, seen = JobChanges([], [], []), set()
+    for job in jobs:
+        if job.uid in seen:
+            continue
+        seen.add(job.uid)
+        if job.uid not in saved:
+            changes.new.append(job)
+            continue
+        job_id, fingerprint = saved[job.uid]
+        if fingerprint is None:
+            changes.backfill.append((job_id, job))
+        elif fingerprint != job.fingerprint:
+            changes.changed.append((job_id, job))
+    return changes
+
+
+async def save_jobs(jobs: list[Job]) -> ScrapeResult:
+    # Insert new jobs and update only the changed ones
+    changes = await diff_jobs(jobs)
+    logger.info("%d new, %d changed, %d backfill jobs", len(changes.new),
+                len(changes.changed), len(changes.backfill))
+    new_jobs: list[JobDetailFull] = list(await asyncio.gather(*(
+        insert_job(job.title, job.uid, job.end_date, job.posted_date, job.fingerprint)
+        for job in changes.new
+    )))
+    updated_jobs = await update_jobs([
+        (job_id, job.title, job.end_date, job.posted_date, job.fingerprint)
+        for job_id, job in changes.changed + changes.backfill
+    ])
+    # Backfilled jobs are not reported, nothing is known about what changed
+    return ScrapeResult(new_jobs, updated_jobs[:len(changes.changed)])
+
+
+async def replay_snapshots(paths: list[str]) -> ScrapeResult:
+    # Feed archived pages, oldest first, through parse and save without network
+    result = ScrapeResult([], [])
+    for path in paths:
+        logger.info("Replay %s", path)
+        content, encoding = await asyncio.to_thread(snapshots.load_snapshot, path)
+        rows = await listings.parse_listings(content, encoding)
+        saved = await save_jobs([Job(*row) for row in rows])
+        result.new.extend(saved.new)
+        result.updated.extend(saved.updated)
+    return result
 
 
 async def extract_job_details() -> Generator[Job, None, None]:
-    async with httpx.AsyncClient(headers=HEADERS) as client:
-        logger.info("GET %s", LOGIN_GET_URL)
-        await client.get(LOGIN_GET_URL)
-        logger.info("POST %s", LOGIN_POST_URL)
-        await client.post(LOGIN_POST_URL, data=PAYLOAD, follow_redirects=True)
+    async with http_client.create_client(base_url=constants.BASE_URL) as client:
+        await http_client.get(client, LOGIN_GET_URL)
+        await http_client.post(client, LOGIN_POST_URL, data=login_payload(),
+                               follow_redirects=True)
         await asyncio.sleep(2)
 
-        logger.info("GET %s", JOBS_URL)
-        jobs_page = await client.get(JOBS_URL)
+        jobs_page = (await http_client.get(client, JOBS_URL)).raise_for_status()
+        try:
+            await asyncio.to_thread(snapshots.save_snapshot, jobs_page.content,
+                                    jobs_page.encoding)
+        except OSError:
+            logger.exception("Something went wrong while saving the snapshot")
 
         logger.info("Begin extraction")
-        html_root = html.fromstring(jobs_page.text)
-        jobs_tbody_ele = html_root.find(".//table[@id='job-listings']/tbody")
-        for i, job in enumerate(jobs_tbody_ele.findall(".//tr"), start=1):
-            title_ele, end_date_ele, posted_date_ele, dates_ele = job.findall(".//td")
-            # Date given as DD/MM/YYYY, reformat as YYYY-MM-DD
-            end_date = "-".join(end_date_ele.text.strip().split("/")[::-1])
-            posted_date = "-".join(posted_date_ele.text.strip().split("/")[::-1])
-            uid = dates_ele.find(".//a").get("href").rsplit("/", 1)[1]
-            yield Job(title_ele.text.strip(), uid, end_date, posted_date)
+        # httpx takes the charset from Content-Type, the bytes alone do not carry it
+        for row in await listings.parse_listings(jobs_page.content, jobs_page.encoding):
+            yield Job(*row)
         logger.info("Done extraction")
 
         await asyncio.sleep(2)
-        logger.info("GET %s", LOGOUT_URL)
-        await client.get(LOGOUT_URL)
+        try:
+            await http_client.get(client, LOGOUT_URL)
+        except (httpx.HTTPError, http_client.CircuitOpenError):
+            # The jobs are already parsed, a failed logout must not discard them
+            logger.exception("Something went wrong while logging out")
+            return
         logger.info("BYE BYE!!")
 
 
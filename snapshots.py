@@ -0,0 +1,63 @@
+import codecs
+import gzip
+import hashlib
+import os
+import tempfile
+
+import constants
+
+SUFFIX = ".html.gz"
+# Snapshots saved before the encoding was part of the name
+DEFAULT_ENCODING = "utf-8"
+
+
+def snapshot_dir() -> str:
+    # A relative SNAPSHOT_DIR is taken from this directory, not the working one
+    root = os.path.dirname(os.path.abspath(__file__))
+    return os.path.normpath(os.path.join(root, constants.SNAPSHOT_DIR))
+
+
+def save_snapshot(content: bytes, encoding: str = DEFAULT_ENCODING) -> str:
+    # Store a fetched listings page named by its sha256 and encoding, identical
+    # pages are kept once and only have their mtime bumped. Returns the path.
+    directory = snapshot_dir()
+    name = f"{hashlib.sha256(content).hexdigest()}.{codecs.lookup(encoding).name}{SUFFIX}"
+    path = os.path.join(directory, name)
+    if os.path.exists(path):
+        os.utime(path)
+    else:
+        os.makedirs(directory, exist_ok=True)
+        # Write then rename so a crash never leaves a truncated snapshot behind
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as fw:
+            fw.write(gzip.compress(content, mtime=0))
+        os.replace(tmp_path, path)
+    prune_snapshots(constants.SNAPSHOT_RETENTION)
+    return path
+
+
+def list_snapshots() -> list[str]:
+    # Snapshot paths, oldest first
+    directory = snapshot_dir()
+    if not os.path.isdir(directory):
+        return []
+    paths = [os.path.join(directory, name) for name in os.listdir(directory)
+             if name.endswith(SUFFIX)]
+    return sorted(paths, key=os.path.getmtime)
+
+
+def prune_snapshots(keep: int) -> list[str]:
+    # Delete all but the `keep` newest snapshots, returns the deleted paths
+    if keep < 1:
+        return []
+    paths = list_snapshots()[:-keep]
+    for path in paths:
+        os.remove(path)
+    return paths
+
+
+def load_snapshot(path: str) -> tuple[bytes, str]:
+    # (content, encoding to parse it with)
+    _, _, encoding = os.path.basename(path)[:-len(SUFFIX)].partition(".")
+    with gzip.open(path, "rb") as fr:
+        return fr.read(), encoding or DEFAULT_ENCODING
@@ -0,0 +1,109 @@
+import csv
+import gzip
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from tests.test_listings import listings_page
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Budget for `import tnp` alone, interpreter start up is not included
+IMPORT_BUDGET = 0.1
+HEAVY_MODULES = ("telegram", "httpx", "lxml", "aiosqlite", "asyncio", "dotenv")
+
+
+def run_python(*args: str, env: dict | None = None,
+               cwd: str = ROOT) -> subprocess.CompletedProcess:
+    # Run without the bot environment variables to prove they are not needed
+    clean_env = {k: v for k, v in os.environ.items()
+                 if k not in ("CHAT_ID", "DB_NAME", "TOKEN", "URL", "USERNAME", "PASSWORD")}
+    return subprocess.run([sys.executable, *args], capture_output=True, text=True,
+                          cwd=cwd, env={**clean_env, **(env or {})})
+
+
+class ImportTimeTestCase(unittest.TestCase):
+    def test_import_tnp_within_budget(self):
+        result = run_python("-c", (
+            "import sys, time; s = time.perf_counter(); import tnp; "
+            "print(time.perf_counter() - s); "
+            f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+        ))
+        self.assertEqual(result.returncode, 0, result.stderr)
+        elapsed, heavy = result.stdout.splitlines()
+        self.assertLess(float(elapsed), IMPORT_BUDGET, "import tnp is over budget")
+        self.assertEqual(heavy, "", "tnp imported heavy modules at import time")
+
+    def test_modules_import_without_environment(self):
+        for module in ("constants", "logger", "database", "scraper"):
+            with self.subTest(module=module):
+                result = run_python("-c", f"import sys, {module}; print('dotenv' in sys.modules)")
+                self.assertEqual(result.returncode, 0, result.stderr)
+                self.assertEqual(result.stdout.strip(), "False", ".env read at import time")
+
+    def test_missing_setting_raises_on_access(self):
+        result = run_python("-c", "import constants; constants.MY_CHAT_ID")
+        self.assertIn("KeyError: 'CHAT_ID'", result.stderr)
+
+
+class CommandTestCase(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+        self.env = {"DB_NAME": os.path.join(self.tmp, "cli.db")}
+
+    def tnp(self, *args: str, cwd: str = ROOT) -> subprocess.CompletedProcess:
+        result = run_python(os.path.join(ROOT, "tnp.py"), *args, env=self.env, cwd=cwd)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        return result
+
+    def test_db_init_and_migrate(self):
+        self.tnp("db", "init")
+        self.assertTrue(os.path.exists(self.env["DB_NAME"]))
+        self.assertIn("migration(s)", self.tnp("db", "migrate").stdout)
+        self.assertIn("Applied 0 migration(s)", self.tnp("db", "migrate").stdout)
+
+    def test_runs_outside_the_repo_directory(self):
+        # Like cron, which starts in the home directory
+        self.tnp("db", "init", cwd=self.tmp)
+        self.assertTrue(os.path.exists(self.env["DB_NAME"]))
+        self.assertIn("migration(s)", self.tnp("db", "migrate", cwd=self.tmp).stdout)
+
+    def test_scrape_migrates_old_database(self):
+        with sqlite3.connect(self.env["DB_NAME"]) as con:
+            con.executescript(
+                "CREATE TABLE job(id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, "
+                "title VARCHAR(255) NOT NULL, uid VARCHAR(255) UNIQUE NOT NULL, "
+                "end_date DATE, posted_date DATE, "
+                "created_at DATETIME DEFAULT CURRENT_TIMESTAMP);"
+                "CREATE TABLE job_status(id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, "
+                "student_id INTEGER NOT NULL, job_id INTEGER NOT NULL, "
+                "interested BOOLEAN DEFAULT FALSE, applied BOOLEAN DEFAULT FALSE, "
+                "skip BOOLEAN DEFAULT FALSE);"
+            )
+        con.close()
+        snapshot = os.path.join(self.tmp, "page.html.gz")
+        with open(snapshot, "wb") as fw:
+            fw.write(gzip.compress(listings_page(2)))
+        self.assertIn("2 new, 0 updated job(s)", self.tnp("scrape", "--replay", snapshot).stdout)
+
+    def test_export_csv_and_json(self):
+        self.tnp("db", "init")
+        rows = list(csv.reader(self.tnp("export").stdout.splitlines()))
+        self.assertEqual(rows[0][:3], ["id", "title", "uid"])
+        output = os.path.join(self.tmp, "students.json")
+        self.tnp("export", "--table", "student", "--format", "json", "-o", output)
+        with open(output) as fr:
+            self.assertEqual(json.load(fr), [])
+
+    def test_unknown_benchmark_fails(self):
+        result = run_python("tnp.py", "bench", "nope", env=self.env)
+        self.assertEqual(result.returncode, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,3 +1,4 @@
+import aiosqlite
 import asyncio
 import datetime as dt
 import database as db
@@ -7,6 +8,8 @@ import os
 import sqlite3
 import unittest
 
+from unittest import mock
+
 
 logger.logger.setLevel(logging.WARNING)
 db.DB_NAME = "test.db"
@@ -29,6 +32,8 @@ class DefaultTestCase(unittest.IsolatedAsyncioTestCase):
         asyncio.run(db.create_table())
 
     async def asyncTearDown(self):
+        await db.stop_writer()
+        db.ACTIVE_JOBS.clear()
         async with db.database_connection() as con:
             for table in ("job", "job_status", "student"):
                 await con.executescript(
@@ -46,7 +51,7 @@ class DefaultTestCase(unittest.IsolatedAsyncioTestCase):
 
 class DatabaseTestCase(DefaultTestCase):
     async def test_all_tables_exist(self):
-        tables = {"job", "student", "job_status"}
+        tables = {"job", "student", "job_status", "change_counter"}
         async with db.database_connection() as con:
             con.row_factory = lambda _, row: row[0]
             result = set(await con.execute_fetchall(
@@ -58,7 +63,8 @@ class DatabaseTestCase(DefaultTestCase):
 
 class JobTableTestCase(DefaultTestCase):
     async def test_job_table_contains_equal_fields(self):
-        fields = {"id", "title", "uid", "end_date", "posted_date", "created_at"}
+        fields = {"id", "title", "uid", "end_date", "posted_date", "fingerprint",
+                  "created_at"}
         self.assertSetEqual(fields, set(await list_of_table_columns('job')),
                             "Set of fields do not match for job table")
 
@@ -98,6 +104,39 @@ class JobTableTestCase(DefaultTestCase):
             await db.insert_job("TEST", uid,
                                 str(dt.date.today()), str(dt.date.today()))
 
+    async def test_insert_job_stores_fingerprint(self):
+        today = str(dt.date.today())
+        await db.insert_job("Test", "abcd", today, today)
+        saved = await db.fetch_job_fingerprints(["abcd", "missing"])
+        self.assertEqual(saved, {"abcd": (1, db.job_fingerprint("Test", today, today))})
+
+    async def test_update_jobs_changes_fields_and_fingerprint(self):
+        today, tomorrow = dt.date.today(), dt.date.today() + dt.timedelta(days=1)
+        job = await db.insert_job("Test", "abcd", str(today), str(today))
+        fingerprint = db.job_fingerprint("Test's", tomorrow, today)
+        result = await db.update_jobs([(job.id, "Test's", str(tomorrow), str(today),
+                                        fingerprint)])
+        self.assertEqual(result[0].id, job.id)
+        async with db.database_connection() as con:
+            con.row_factory = sqlite3.Row
+            async with con.execute("SELECT * FROM job;") as cursor:
+                row = await cursor.fetchone()
+        self.assertEqual((row["title"], row["end_date"], row["fingerprint"]),
+                         ("Test's", tomorrow, fingerprint))
+
+    async def test_migrate_adds_fingerprint_to_old_table(self):
+        async with db.database_connection() as con:
+            await con.executescript(
+                "DROP TABLE job; PRAGMA user_version=0;"
+                "CREATE TABLE job(id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, "
+                "title VARCHAR(255) NOT NULL, uid VARCHAR(255) UNIQUE NOT NULL, "
+                "end_date DATE, posted_date DATE, "
+                "created_at DATETIME DEFAULT CURRENT_TIMESTAMP);"
+            )
+        self.assertEqual(await db.migrate(), len(db.MIGRATIONS))
+        self.assertIn("fingerprint", await list_of_table_columns("job"))
+        self.assertEqual(await db.migrate(), 0)
+
 
 class StudentTableTestCase(DefaultTestCase):
     CHAT_ID, USERNAME, FULL_NAME = "23234", "username", "full_name"
@@ -183,5 +222,193 @@ class JobStatusTableTestCase(DefaultTestCase):
                             "Set of fields do not match for job_status table")
 
 
+class WriterTestCase(DefaultTestCase):
+    async def test_concurrent_writes_are_group_committed(self):
+        students = await asyncio.gather(*(
+            db.insert_student(str(i), f"username{i}", f"full_name{i}") for i in range(50)
+        ))
+        self.assertEqual(sorted(student.id for student in students), list(range(1, 51)))
+        self.assertLess(db.start_writer().commits, 50, "Writes were not batched")
+        async with db.database_connection() as con:
+            result = await con.execute("SELECT COUNT(*) FROM student;")
+            self.assertEqual((await result.fetchone())[0], 50)
+
+    async def test_failing_write_does_not_affect_batch(self):
+        await db.insert_student("1", "username", "full_name")
+        results = await asyncio.gather(
+            db.insert_student("2", "username2", "full_name2"),
+            db.insert_student("3", "username", "duplicate"),
+            db.insert_student("4", "username4", "full_name4"),
+            return_exceptions=True
+        )
+        self.assertIsInstance(results[0], db.StudentDetail)
+        self.assertIsInstance(results[1], sqlite3.IntegrityError)
+        self.assertIsInstance(results[2], db.StudentDetail)
+        self.assertTrue(await db.student_exists("2"))
+        self.assertFalse(await db.student_exists("3"))
+        self.assertTrue(await db.student_exists("4"))
+
+    async def test_concurrent_job_status_updates_insert_once(self):
+        await db.insert_student("1", "username", "full_name")
+        job = await db.insert_job("Test", "abcd", str(dt.date.today()), str(dt.date.today()))
+        await asyncio.gather(
+            db.update_job_status_field(1, job.id, "interested", True),
+            db.update_job_status_field(1, job.id, "applied", True),
+        )
+        async with db.database_connection() as con:
+            result = await con.execute("SELECT COUNT(*), interested, applied FROM job_status;")
+            self.assertEqual(tuple(await result.fetchone()), (1, 1, 1))
+
+    async def test_locked_database_fails_batch_and_writer_recovers(self):
+        await db.stop_writer()
+        db.start_writer(busy_timeout=0.1)
+        await db.insert_student("1", "username1", "full_name1")
+        async with db.database_connection() as con:
+            # Another process holding the write lock, e.g. a tnp cron job
+            await con.execute("BEGIN IMMEDIATE;")
+            with self.assertRaisesRegex(sqlite3.OperationalError, "locked"):
+                await asyncio.wait_for(db.insert_student("2", "username2", "full_name2"), 2)
+            await con.rollback()
+        result = await asyncio.wait_for(db.insert_student("3", "username3", "full_name3"), 2)
+        self.assertIsInstance(result, db.StudentDetail)
+        self.assertFalse(await db.student_exists("2"))
+
+    async def test_failed_commit_fails_every_write(self):
+        with mock.patch.object(aiosqlite.Connection, "commit",
+                               side_effect=sqlite3.OperationalError("disk I/O error")):
+            results = await asyncio.gather(
+                db.insert_student("1", "username1", "full_name1"),
+                db.insert_job("Test", "abcd", str(dt.date.today()), str(dt.date.today())),
+                return_exceptions=True
+            )
+        self.assertTrue(all(isinstance(r, sqlite3.OperationalError) for r in results))
+        self.assertFalse(await db.student_exists("1"))
+        self.assertNotIn("abcd", await db.fetch_job_fingerprints(["abcd"]))
+
+    async def test_dead_writer_is_replaced(self):
+        writer = db.start_writer()
+        writer.task.cancel()
+        await asyncio.gather(writer.task, return_exceptions=True)
+        self.assertIsNot(db.start_writer(), writer)
+        self.assertIsInstance(await db.insert_student("1", "username", "full_name"),
+                              db.StudentDetail)
+
+    async def test_stop_writer_applies_pending_writes(self):
+        pending = asyncio.ensure_future(db.insert_student("1", "username", "full_name"))
+        await asyncio.sleep(0)
+        await db.stop_writer()
+        self.assertIsInstance(await pending, db.StudentDetail)
+
+
+class ActiveJobsIndexTestCase(DefaultTestCase):
+    async def asyncSetUp(self):
+        today = dt.date.today()
+        self.students = [await db.insert_student(str(i), f"username{i}", f"name{i}")
+                         for i in range(1, 4)]
+        self.jobs = [
+            await db.insert_job(f"Job {i}", f"uid{i}",
+                                str(today + dt.timedelta(days=days)),
+                                str(today - dt.timedelta(days=abs(days))))
+            for i, days in enumerate((-2, 0, 1, 2, 5, 5))
+        ]
+
+    async def assert_index_matches_sql(self):
+        for student in self.students:
+            for near_end_date in (False, True):
+                self.assertEqual(await db.fetch_active_jobs(student.id, near_end_date),
+                                 await db.fetch_active_jobs_sql(student.id, near_end_date))
+        self.assertEqual(await db.verify_index(), [])
+
+    async def test_active_jobs_exclude_expired_applied_and_skipped(self):
+        expired, today, tomorrow, *_ = self.jobs
+        await db.update_job_status_field(1, today.id, "applied", True)
+        await db.update_job_status_field(1, tomorrow.id, "skip", True)
+        await db.update_job_status_field(1, self.jobs[3].id, "interested", True)
+        active = [job.id for job in await db.fetch_active_jobs(self.students[0].id)]
+        # posted_date DESC, ties by id DESC
+        self.assertEqual(active, [self.jobs[3].id, self.jobs[5].id, self.jobs[4].id])
+        self.assertNotIn(expired.id, [job.id for job in
+                                      await db.fetch_active_jobs(self.students[1].id)])
+        await self.assert_index_matches_sql()
+
+    async def test_writes_keep_index_in_sync_without_reload(self):
+        await db.load_index()
+        counter = db.ACTIVE_JOBS.counter
+        job = self.jobs[1]
+        await db.update_job_status_field(2, job.id, "skip", True)
+        await db.update_job_status_field(2, job.id, "skip", False)
+        await db.update_job_status_field(3, job.id, "applied", True)
+        new_job = await db.insert_job("New", "new", str(dt.date.today()), str(dt.date.today()))
+        await db.update_jobs([(self.jobs[2].id, "Renamed", str(dt.date.today()),
+                               str(dt.date.today()), "fingerprint")])
+        # Own writes advance the counter, so the next check does not reload
+        self.assertGreater(db.ACTIVE_JOBS.counter, counter)
+        self.addCleanup(setattr, db.ACTIVE_JOBS, "check_interval", db.ACTIVE_JOBS.check_interval)
+        db.ACTIVE_JOBS.check_interval = 0
+        version = db.ACTIVE_JOBS.version
+        await db.load_index()
+        self.assertEqual(db.ACTIVE_JOBS.version, version, "Index was reloaded")
+        self.assertIn(new_job.id, db.ACTIVE_JOBS.jobs)
+        self.assertTrue(db.ACTIVE_JOBS.has_status(3, job.id, "applied"))
+        self.assertFalse(db.ACTIVE_JOBS.has_status(2, job.id, "skip"))
+        await self.assert_index_matches_sql()
+
+    async def test_verify_index_reports_out_of_band_writes(self):
+        await db.load_index()
+        async with db.database_connection() as con:
+            await con.execute("INSERT INTO job_status(student_id, job_id, skip) VALUES "
+                              f"({self.students[1].id}, {self.jobs[1].id}, TRUE);")
+            await con.commit()
+        self.assertEqual(await db.verify_index(), [self.students[1].id])
+        await db.load_index(force=True)
+        self.assertEqual(await db.verify_index(), [])
+
+    async def test_writes_by_other_processes_reload_index(self):
+        await db.load_index()
+        self.addCleanup(setattr, db.ACTIVE_JOBS, "check_interval", db.ACTIVE_JOBS.check_interval)
+        db.ACTIVE_JOBS.check_interval = 0
+        async with db.database_connection() as con:
+            await con.execute("INSERT INTO job_status(student_id, job_id, applied) VALUES (?, ?, TRUE);",
+                              (self.students[2].id, self.jobs[4].id))
+            await con.commit()
+        self.assertNotIn(self.jobs[4].id,
+                         [job.id for job in await db.fetch_active_jobs(self.students[2].id)])
+        await self.assert_index_matches_sql()
+
+    async def test_extending_expired_job_between_live_ids_reloads_index(self):
+        today = dt.date.today()
+        expired = await db.insert_job("Expired", "expired", str(today - dt.timedelta(days=1)),
+                                      str(today - dt.timedelta(days=3)))
+        await db.insert_job("Later", "later", str(today), str(today))
+        await db.update_job_status_field(self.students[0].id, expired.id, "applied", True)
+        await db.load_index(force=True)
+        self.assertLess(db.ACTIVE_JOBS.base, expired.id)
+        await db.update_jobs([(expired.id, "Extended", str(today), str(today - dt.timedelta(days=3)),
+                               "fingerprint")])
+        self.assertNotIn(expired.id,
+                         [job.id for job in await db.fetch_active_jobs(self.students[0].id)])
+        await self.assert_index_matches_sql()
+
+    async def test_statuses_kept_for_live_jobs_only(self):
+        expired = self.jobs[0]
+        await db.update_job_status_field(1, expired.id, "applied", True)
+        await db.update_job_status_field(1, self.jobs[1].id, "interested", True)
+        await db.load_index(force=True)
+        self.assertEqual(db.ACTIVE_JOBS.status, {"applied": {}, "skip": {}})
+        # Extending the expired job needs its statuses, so the index is reloaded
+        await db.update_jobs([(expired.id, "Extended", str(dt.date.today()),
+                               str(dt.date.today()), "fingerprint")])
+        self.assertFalse(db.ACTIVE_JOBS.loaded)
+        self.assertNotIn(expired.id,
+                         [job.id for job in await db.fetch_active_jobs(self.students[0].id)])
+        await self.assert_index_matches_sql()
+        await db.update_job_status_field(1, self.jobs[2].id, "skip", True)
+        # Job 2 expires, its bit goes with it and the empty bitset is dropped
+        day_after = dt.datetime.combine(dt.date.today() + dt.timedelta(days=2), dt.time())
+        db.ACTIVE_JOBS.active(self.students[0].id, now=day_after)
+        self.assertNotIn(self.jobs[2].id, db.ACTIVE_JOBS.jobs)
+        self.assertEqual(db.ACTIVE_JOBS.status["skip"], {})
+
+
 if __name__ == "__main__":
     unittest.main()
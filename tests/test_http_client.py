@@ -0,0 +1,111 @@
+import http_client
+import httpx
+import logging
+import logger
+import threading
+import unittest
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+logger.logger.setLevel(logging.WARNING)
+
+
+class PortalStandIn(BaseHTTPRequestHandler):
+    # Replies with the queued status codes one by one, then with 200
+    statuses: list[int] = []
+    hits = 0
+
+    def do_GET(self):
+        type(self).hits += 1
+        status = self.statuses.pop(0) if self.statuses else 200
+        body = f"status {status}".encode()
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_POST = do_GET
+
+    def log_message(self, *args):
+        pass
+
+
+class HttpClientTestCase(unittest.IsolatedAsyncioTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), PortalStandIn)
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        PortalStandIn.statuses, PortalStandIn.hits = [], 0
+        self.breaker = http_client.CircuitBreaker(failure_threshold=3, reset_timeout=60)
+        patcher = mock.patch("http_client.backoff_delay", return_value=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_get_retries_server_errors(self):
+        PortalStandIn.statuses = [503, 502]
+        async with http_client.create_client() as client:
+            response = await http_client.get(client, self.url, breaker=self.breaker)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(PortalStandIn.hits, 3)
+        self.assertEqual(self.breaker.state, "closed")
+
+    async def test_get_raises_after_retries_exhausted(self):
+        PortalStandIn.statuses = [500] * 3
+        async with http_client.create_client() as client:
+            with self.assertRaises(httpx.HTTPStatusError):
+                await http_client.get(client, self.url, retries=2, breaker=self.breaker)
+        self.assertEqual(PortalStandIn.hits, 3)
+
+    async def test_post_is_not_retried(self):
+        PortalStandIn.statuses = [503]
+        async with http_client.create_client() as client:
+            with self.assertRaises(httpx.HTTPStatusError):
+                await http_client.post(client, self.url, breaker=self.breaker)
+        self.assertEqual(PortalStandIn.hits, 1)
+
+    async def test_client_errors_are_returned_without_retry(self):
+        PortalStandIn.statuses = [404]
+        async with http_client.create_client() as client:
+            response = await http_client.get(client, self.url, breaker=self.breaker)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(PortalStandIn.hits, 1)
+
+    async def test_circuit_opens_after_repeated_failures(self):
+        PortalStandIn.statuses = [500] * 3
+        async with http_client.create_client() as client:
+            with self.assertRaises(httpx.HTTPStatusError):
+                await http_client.get(client, self.url, retries=2, breaker=self.breaker)
+            self.assertEqual(self.breaker.state, "open")
+            with self.assertRaises(http_client.CircuitOpenError):
+                await http_client.get(client, self.url, breaker=self.breaker)
+        self.assertEqual(PortalStandIn.hits, 3, "Request sent while circuit open")
+
+    async def test_half_open_circuit_closes_on_success(self):
+        self.breaker.reset_timeout = 0
+        for _ in range(3):
+            self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, "half-open")
+        async with http_client.create_client() as client:
+            await http_client.get(client, self.url, breaker=self.breaker)
+        self.assertEqual(self.breaker.state, "closed")
+
+    async def test_connection_errors_are_retried(self):
+        async with http_client.create_client(timeout=1) as client:
+            with self.assertRaises(httpx.ConnectError):
+                # Nothing listens on port 1
+                await http_client.get(client, "http://127.0.0.1:1", retries=1,
+                                      breaker=self.breaker)
+        self.assertEqual(self.breaker.failures, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
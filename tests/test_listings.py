@@ -0,0 +1,67 @@
+import listings
+import os
+import unittest
+
+from unittest import mock
+
+
+def listings_page(rows: int, title: str = "Job", encoding: str = "utf-8") -> bytes:
+    body = "".join(
+        f"<tr><td> {title} {i} </td><td> 0{i % 9 + 1}/07/2026 </td><td>01/06/2026</td>"
+        f"<td><a href='/jobs/view/uid{i}'>View</a></td></tr>"
+        for i in range(rows)
+    )
+    return (f"<html><body><table id='job-listings'><thead><tr><th>Title</th></tr></thead>"
+            f"<tbody>{body}</tbody></table></body></html>").encode(encoding)
+
+
+class ParseListingsTestCase(unittest.IsolatedAsyncioTestCase):
+    def tearDown(self):
+        listings.shutdown_pool()
+
+    def test_parse_job_rows(self):
+        self.assertEqual(listings.parse_job_rows(listings_page(2)), [
+            ("Job 0", "uid0", "2026-07-01", "2026-06-01"),
+            ("Job 1", "uid1", "2026-07-02", "2026-06-01"),
+        ])
+
+    async def test_non_ascii_titles_use_given_encoding(self):
+        for encoding in ("utf-8", "cp1252"):
+            content = listings_page(50, "Ingénieur – Café", encoding)
+            for inline_max in (len(content), 0):
+                with self.subTest(encoding=encoding, inline_max=inline_max), \
+                        mock.patch("constants.PARSE_INLINE_MAX_BYTES", inline_max, create=True):
+                    rows = await listings.parse_listings(content, encoding)
+                    self.assertEqual(rows[1][0], "Ingénieur – Café 1")
+
+    async def test_small_page_is_parsed_inline(self):
+        with mock.patch("listings.parse_pool") as parse_pool:
+            rows = await listings.parse_listings(listings_page(3))
+        parse_pool.assert_not_called()
+        self.assertEqual(len(rows), 3)
+
+    async def test_large_page_is_parsed_in_worker(self):
+        with mock.patch("constants.PARSE_INLINE_MAX_BYTES", 0, create=True):
+            rows = await listings.parse_listings(listings_page(50))
+        self.assertIsNotNone(listings._pool, "Worker pool was not used")
+        self.assertEqual(rows, listings.parse_job_rows(listings_page(50)))
+
+    async def test_broken_pool_is_replaced(self):
+        with self.assertRaises(listings.BrokenProcessPool):
+            listings.parse_pool().submit(os._exit, 1).result()
+        broken = listings._pool
+        with mock.patch("constants.PARSE_INLINE_MAX_BYTES", 0, create=True):
+            rows = await listings.parse_listings(listings_page(5))
+        self.assertEqual(len(rows), 5)
+        self.assertIsNot(listings._pool, broken, "Broken pool was kept")
+
+    async def test_zero_workers_parses_inline(self):
+        with mock.patch("constants.PARSE_INLINE_MAX_BYTES", 0, create=True), \
+                mock.patch("constants.PARSE_WORKERS", 0, create=True):
+            rows = await listings.parse_listings(listings_page(5))
+        self.assertIsNone(listings._pool)
+        self.assertEqual(len(rows), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import json
+import logging
+import logger
+import queue
+import sys
+import unittest
+
+from unittest import mock
+
+
+def make_record(msg="Get details for id-%d", args=(1,), lineno=10, level=logging.INFO,
+                **extra) -> logging.LogRecord:
+    record = logging.LogRecord("test", level, "database.py", lineno, msg, args, None,
+                               func="fetch_one_job")
+    record.__dict__.update(extra)
+    return record
+
+
+class JsonFormatterTestCase(unittest.TestCase):
+    def test_message_and_extra_fields(self):
+        data = json.loads(logger.JsonFormatter().format(
+            make_record(chat_id=12, job_id=1, duration=0.5)
+        ))
+        self.assertEqual(data["message"], "Get details for id-1")
+        self.assertEqual(data["level"], "INFO")
+        self.assertEqual(data["where"], "database.fetch_one_job")
+        self.assertEqual((data["chat_id"], data["job_id"], data["duration"]), (12, 1, 0.5))
+        self.assertNotIn("student_id", data)
+
+    def test_exception_is_included(self):
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            record = make_record("boom", ())
+            record.exc_info = sys.exc_info()
+        data = json.loads(logger.JsonFormatter().format(record))
+        self.assertIn("ZeroDivisionError", data["exc_info"])
+
+
+class TextFormatterTestCase(unittest.TestCase):
+    def test_suppressed_count_is_shown(self):
+        formatter = logger.build_formatter("text")
+        self.assertTrue(formatter.format(make_record()).endswith(
+            "database.fetch_one_job: Get details for id-1"
+        ))
+        self.assertTrue(formatter.format(make_record(suppressed=4)).endswith(
+            "Get details for id-1 (4 similar suppressed)"
+        ))
+
+
+class RateLimitFilterTestCase(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch("logger.time.monotonic", return_value=100.0)
+        self.monotonic = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_disabled_by_default(self):
+        rate_limit = logger.RateLimitFilter(0)
+        self.assertTrue(all(rate_limit.filter(make_record()) for _ in range(100)))
+
+    def test_limits_per_call_site(self):
+        rate_limit = logger.RateLimitFilter(1, burst=3)
+        passed = [rate_limit.filter(make_record()) for _ in range(10)]
+        self.assertEqual(passed.count(True), 3)
+        self.assertTrue(rate_limit.filter(make_record(lineno=20)),
+                        "Other call site should have its own bucket")
+
+    def test_refills_and_reports_suppressed(self):
+        rate_limit = logger.RateLimitFilter(2, burst=1)
+        self.assertTrue(rate_limit.filter(make_record()))
+        self.assertFalse(rate_limit.filter(make_record()))
+        self.assertFalse(rate_limit.filter(make_record()))
+        self.monotonic.return_value = 100.5
+        record = make_record()
+        self.assertTrue(rate_limit.filter(record))
+        self.assertEqual(record.suppressed, 2)
+
+    def test_warnings_are_never_limited(self):
+        rate_limit = logger.RateLimitFilter(1, burst=1)
+        self.assertTrue(all(rate_limit.filter(make_record(level=logging.WARNING))
+                            for _ in range(10)))
+
+
+class QueueHandlerTestCase(unittest.TestCase):
+    def test_logger_only_enqueues(self):
+        self.assertEqual(logger.logger.handlers, [logger.queue_handler])
+
+    def test_prepare_merges_args_and_keeps_extra(self):
+        handler = logger.LocalQueueHandler(queue.SimpleQueue())
+        handler.handle(make_record(chat_id=5))
+        record = handler.queue.get_nowait()
+        self.assertEqual((record.msg, record.args), ("Get details for id-1", None))
+        self.assertEqual(record.chat_id, 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
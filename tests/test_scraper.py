@@ -0,0 +1,83 @@
+import constants
+import datetime as dt
+import database as db
+import http_client
+import httpx
+import scraper
+import unittest
+
+from tests import test_database
+from tests.test_listings import listings_page
+from unittest import mock
+
+
+def make_job(uid: str, title: str = "Test", days: int = 0) -> scraper.Job:
+    today = dt.date.today()
+    return scraper.Job(title, uid, str(today + dt.timedelta(days=days)), str(today))
+
+
+class SaveJobsTestCase(test_database.DefaultTestCase):
+    async def test_new_jobs_are_inserted(self):
+        result = await scraper.save_jobs([make_job("a"), make_job("b"), make_job("a")])
+        self.assertEqual([job.title for job in result.new], ["Test", "Test"])
+        self.assertEqual(result.updated, [])
+        self.assertEqual(set(await db.fetch_job_fingerprints(["a", "b"])), {"a", "b"})
+
+    async def test_titles_with_quotes_are_saved(self):
+        result = await scraper.save_jobs([make_job("a", title="Dev's Role"), make_job("b")])
+        self.assertEqual([job.title for job in result.new], ["Dev's Role", "Test"])
+        changes = await scraper.diff_jobs([make_job("a", title="Dev's Role")])
+        self.assertEqual(changes, scraper.JobChanges([], [], []))
+
+    async def test_only_changed_jobs_are_updated(self):
+        await scraper.save_jobs([make_job("a"), make_job("b")])
+        changes = await scraper.diff_jobs([make_job("a"), make_job("b", days=3),
+                                           make_job("c")])
+        self.assertEqual([job.uid for job in changes.new], ["c"])
+        self.assertEqual([(job_id, job.uid) for job_id, job in changes.changed], [(2, "b")])
+
+        result = await scraper.save_jobs([make_job("a"), make_job("b", days=3)])
+        self.assertEqual(result.new, [])
+        self.assertEqual([job.id for job in result.updated], [2])
+        saved = await db.fetch_job_fingerprints(["b"])
+        self.assertEqual(saved["b"][1], make_job("b", days=3).fingerprint)
+        self.assertEqual(await scraper.save_jobs([make_job("b", days=3)]),
+                         scraper.ScrapeResult([], []))
+
+    async def test_jobs_without_fingerprint_are_backfilled_silently(self):
+        await scraper.save_jobs([make_job("a")])
+        async with db.database_connection() as con:
+            await con.execute("UPDATE job SET fingerprint=NULL;")
+            await con.commit()
+        changes = await scraper.diff_jobs([make_job("a", title="Fixed")])
+        self.assertEqual([job.uid for _, job in changes.backfill], ["a"])
+        self.assertEqual(await scraper.save_jobs([make_job("a", title="Fixed")]),
+                         scraper.ScrapeResult([], []))
+        saved = await db.fetch_job_fingerprints(["a"])
+        self.assertEqual(saved["a"][1], make_job("a", title="Fixed").fingerprint)
+
+
+class ExtractJobsTestCase(test_database.DefaultTestCase):
+    def portal(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path == scraper.JOBS_URL:
+            return httpx.Response(200, content=listings_page(2))
+        if request.url.path == scraper.LOGOUT_URL:
+            return httpx.Response(503)
+        return httpx.Response(200)
+
+    async def test_failed_logout_keeps_scraped_jobs(self):
+        transport = httpx.MockTransport(self.portal)
+        settings = {"BASE_URL": "http://portal", "USERNAME": "user", "PASSWORD": "secret"}
+        with mock.patch("http_client.create_client",
+                        lambda **kwargs: httpx.AsyncClient(transport=transport, **kwargs)), \
+                mock.patch("http_client.backoff_delay", return_value=0), \
+                mock.patch("http_client.PORTAL_BREAKER", http_client.CircuitBreaker()), \
+                mock.patch("scraper.asyncio.sleep", mock.AsyncMock()), \
+                mock.patch("snapshots.save_snapshot"), \
+                mock.patch.dict(constants.__dict__, settings):
+            result = await scraper.get_and_save_new_jobs()
+        self.assertEqual([job.title for job in result.new], ["Job 0", "Job 1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
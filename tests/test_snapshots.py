@@ -0,0 +1,86 @@
+import gzip
+import os
+import snapshots
+import scraper
+import tempfile
+import unittest
+
+from tests import test_database
+from tests.test_listings import listings_page
+from unittest import mock
+
+
+class SnapshotTestCase(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        for name, value in (("SNAPSHOT_DIR", self.dir), ("SNAPSHOT_RETENTION", 3)):
+            patcher = mock.patch(f"constants.{name}", value, create=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def save(self, content: bytes, mtime: int) -> str:
+        path = snapshots.save_snapshot(content)
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_snapshot_round_trip_is_compressed(self):
+        content = listings_page(100)
+        path = snapshots.save_snapshot(content)
+        self.assertTrue(path.endswith(".utf-8.html.gz"))
+        self.assertLess(os.path.getsize(path), len(content))
+        self.assertEqual(snapshots.load_snapshot(path), (content, "utf-8"))
+
+    def test_snapshot_keeps_encoding(self):
+        content = listings_page(2, "Café", "cp1252")
+        path = snapshots.save_snapshot(content, "windows-1252")
+        self.assertEqual(snapshots.load_snapshot(path), (content, "cp1252"))
+
+    def test_identical_pages_are_stored_once(self):
+        first = self.save(listings_page(1), 1000)
+        self.save(listings_page(2), 2000)
+        self.assertEqual(snapshots.save_snapshot(listings_page(1)), first)
+        self.assertEqual(len(os.listdir(self.dir)), 2)
+        self.assertEqual(snapshots.list_snapshots()[-1], first, "mtime was not bumped")
+
+    def test_retention_keeps_newest(self):
+        paths = [self.save(listings_page(rows), 1000 * rows) for rows in range(1, 5)]
+        self.assertEqual(snapshots.list_snapshots(), paths[1:])
+
+    def test_relative_dir_is_under_the_repo(self):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        with mock.patch("constants.SNAPSHOT_DIR", "./snapshots", create=True):
+            self.assertEqual(snapshots.snapshot_dir(), os.path.join(root, "snapshots"))
+        self.assertEqual(snapshots.snapshot_dir(), self.dir)
+
+    def test_zero_retention_keeps_all(self):
+        with mock.patch("constants.SNAPSHOT_RETENTION", 0, create=True):
+            for rows in range(1, 6):
+                self.save(listings_page(rows), 1000 * rows)
+        self.assertEqual(len(snapshots.list_snapshots()), 5)
+
+
+class ReplayTestCase(test_database.DefaultTestCase):
+    async def test_replay_inserts_then_updates(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            old, new = os.path.join(tmp, "old.html.gz"), os.path.join(tmp, "new.html.gz")
+            with open(old, "wb") as fw:
+                fw.write(gzip.compress(listings_page(2)))
+            with open(new, "wb") as fw:
+                fw.write(gzip.compress(
+                    listings_page(3).replace(b"Job 1", b"Job 1 fixed")
+                ))
+            # Saved with the encoding of the response it came from
+            latin = os.path.join(tmp, "latin.cp1252.html.gz")
+            with open(latin, "wb") as fw:
+                fw.write(gzip.compress(listings_page(3, "Café", "cp1252")))
+            result = await scraper.replay_snapshots([old, new, latin])
+        self.assertEqual([job.title for job in result.new],
+                         ["Job 0", "Job 1", "Job 2"])
+        self.assertEqual([job.title for job in result.updated],
+                         ["Job 1 fixed", "Café 0", "Café 1", "Café 2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
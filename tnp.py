@@ -0,0 +1,146 @@
+"""Command line entry point for one-shot jobs.
+
+Heavy modules (telegram, httpx, lxml) are only imported by the subcommands
+that need them so cron jobs start fast.
+
+    python tnp.py db init
+    python tnp.py db migrate
+    python tnp.py scrape [--dry-run] [--replay [SNAPSHOT ...]]
+    python tnp.py export [--table job] [--format csv|json] [-o FILE]
+    python tnp.py bench [NAME ...]
+"""
+import argparse
+import sys
+
+
+async def cmd_db_init(args: argparse.Namespace) -> int:
+    import database
+    await database.create_table()
+    return 0
+
+
+async def cmd_db_migrate(args: argparse.Namespace) -> int:
+    import database
+    count = await database.migrate()
+    print(f"Applied {count} migration(s)")
+    return 0
+
+
+async def cmd_scrape(args: argparse.Namespace) -> int:
+    import database
+    import scraper
+    # Like the bot on start up, cron may run against a database from before
+    # the fingerprint column and change_counter triggers
+    await database.migrate()
+    if args.replay is not None:
+        import snapshots
+        paths = args.replay or snapshots.list_snapshots()
+        if not paths:
+            print("No snapshots to replay", file=sys.stderr)
+            return 1
+    if not args.dry_run:
+        if args.replay is not None:
+            result = await scraper.replay_snapshots(paths)
+        else:
+            result = await scraper.get_and_save_new_jobs()
+        for status, jobs in (("NEW", result.new), ("UPDATED", result.updated)):
+            for job in jobs:
+                print(f"{status} {job.id} {job.title} {job.end_date}")
+        print(f"{len(result.new)} new, {len(result.updated)} updated job(s)")
+        return 0
+    if args.replay is not None:
+        import listings
+        # Later snapshots win for the same uid, like replaying them in order would
+        latest = {}
+        for path in paths:
+            for row in await listings.parse_listings(*snapshots.load_snapshot(path)):
+                latest[row[1]] = scraper.Job(*row)
+        jobs = list(latest.values())
+    else:
+        jobs = [job async for job in scraper.extract_job_details()]
+    changes = await scraper.diff_jobs(jobs)
+    for job in changes.new:
+        print(f"NEW {job.uid} {job.title} {job.end_date}")
+    for _, job in changes.changed:
+        print(f"CHANGED {job.uid} {job.title} {job.end_date}")
+    print(f"{len(changes.new)} new, {len(changes.changed)} changed job(s), nothing saved")
+    return 0
+
+
+async def cmd_export(args: argparse.Namespace) -> int:
+    import database
+    columns, rows = await database.dump_table(args.table)
+    out = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        if args.format == "json":
+            import json
+            json.dump([dict(zip(columns, row)) for row in rows], out,
+                      default=str, indent=2)
+            out.write("\n")
+        else:
+            import csv
+            writer = csv.writer(out)
+            writer.writerow(columns)
+            writer.writerows(rows)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+async def cmd_bench(args: argparse.Namespace) -> int:
+    import bench
+    return await bench.run(args.names)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="tnp", description="T&P scraper tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    db_parser = commands.add_parser("db", help="Database maintenance")
+    db_commands = db_parser.add_subparsers(dest="db_command", required=True)
+    db_commands.add_parser("init", help="Create the tables").set_defaults(func=cmd_db_init)
+    db_commands.add_parser("migrate", help="Apply pending migrations").set_defaults(
+        func=cmd_db_migrate
+    )
+
+    scrape_parser = commands.add_parser("scrape", help="Scrape the portal once")
+    scrape_parser.add_argument("--dry-run", action="store_true",
+                               help="Print the scraped jobs without saving them")
+    scrape_parser.add_argument("--replay", nargs="*", metavar="SNAPSHOT",
+                               help="Use archived pages instead of the portal, "
+                                    "default all in SNAPSHOT_DIR oldest first")
+    scrape_parser.set_defaults(func=cmd_scrape)
+
+    export_parser = commands.add_parser("export", help="Export a table")
+    export_parser.add_argument("--table", default="job",
+                               choices=("job", "student", "job_status"))
+    export_parser.add_argument("--format", default="csv", choices=("csv", "json"))
+    export_parser.add_argument("-o", "--output", help="Write to file instead of stdout")
+    export_parser.set_defaults(func=cmd_export)
+
+    bench_parser = commands.add_parser("bench", help="Run micro benchmarks")
+    bench_parser.add_argument("names", nargs="*", help="Benchmarks to run, default all")
+    bench_parser.set_defaults(func=cmd_bench)
+    return parser
+
+
+async def run(args: argparse.Namespace) -> int:
+    try:
+        return await args.func(args)
+    finally:
+        if "listings" in sys.modules:
+            sys.modules["listings"].shutdown_pool()
+        if "database" in sys.modules:
+            # Flush writes queued on the database writer before exiting
+            await sys.modules["database"].stop_writer()
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    import asyncio
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())